@@ -0,0 +1,33 @@
+"""
+Batch job moving returned loans from loans to loans_history.
+
+Usage: python archive_loans.py [--db library.db] [--older-than-days 30]
+                               [--chunk-size 500] [--pause 0.05]
+
+Loans are moved in chunks, each in its own short transaction, so the app
+can keep writing while the job runs.
+"""
+import argparse
+import time
+from datetime import date, timedelta
+
+from database import Database
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive returned loans into loans_history")
+    parser.add_argument('--db', default='library.db', help="database file (default: library.db)")
+    parser.add_argument('--older-than-days', type=int, default=30, help="only loans returned at least this many days ago (default: 30)")
+    parser.add_argument('--chunk-size', type=int, default=500, help="loans per transaction (default: 500)")
+    parser.add_argument('--pause', type=float, default=0.05, help="seconds to sleep between chunks (default: 0.05)")
+    args = parser.parse_args()
+
+    returned_before = date.today() - timedelta(days=args.older_than_days) if args.older_than_days else None
+    started = time.perf_counter()
+    with Database(args.db) as db:
+        moved = db.archive_closed_loans(args.chunk_size, returned_before, pause=args.pause)
+    print(f"Archived {moved} loans in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
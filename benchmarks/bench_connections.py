@@ -0,0 +1,68 @@
+"""
+Compare per-call connect/close against Database's persistent connections.
+
+Usage: python benchmarks/bench_connections.py [iterations]
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from database import Database
+
+
+class PerCallDatabase(Database):
+    """
+    Database that opens and closes a connection for every method call,
+    which is how every method behaved before connections were kept open
+    """
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=self.timeout)
+
+    def _release(self, conn):
+        conn.close()
+
+
+def login_click(db, username):
+    """
+    The lookups a single login + borrow click performs
+    """
+    db.get_user(username)
+    db.get_current_subscription(username)
+    db.get_book(1)
+    db.get_loan(1, 'CAT-1')
+
+
+def run(db_class, db_path, iterations):
+    db = db_class(db_path)
+    try:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            login_click(db, 'reader')
+        return time.perf_counter() - start
+    finally:
+        db.close()
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        with Database(db_path) as db:
+            db.add_user('reader', 'salt:hash', 'reader@library.com')
+            db.add_book('CAT-1', 'C1', '2024-01-01', title='Title', author='Author', publisher='Publisher')
+
+        per_call = run(PerCallDatabase, db_path, iterations)
+        persistent = run(Database, db_path, iterations)
+
+    print(f"{iterations} clicks x 4 queries")
+    print(f"per-call connect : {per_call:.3f}s ({per_call / iterations * 1e6:.0f} us/click)")
+    print(f"persistent       : {persistent:.3f}s ({persistent / iterations * 1e6:.0f} us/click)")
+    print(f"speedup          : {per_call / persistent:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Latency of typo-tolerant catalog search (search_livres_fuzzy) next to the
+exact FTS search, on a generated catalog.
+
+Usage: python benchmarks/bench_fuzzy_search.py [books]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from database import Database
+
+SYLLABLES = ('ma', 'ri', 'lé', 'on', 'ca', 'vé', 'tor', 'hu', 'go', 'zo', 'la', 'bal', 'zac', 'mi', 'sé', 'ra',
+             'ber', 'nard', 'è', 'du', 'mas', 'flau', 'sand', 'pé', 'rec')
+KEYWORDS = ('roman', 'poésie', 'théâtre', 'histoire', 'philosophie', 'essai', 'jeunesse', 'policier')
+QUERIES = ('victor hugot', 'emile zolla', 'poesie', 'theatre', 'baslac', 'xyzzy')
+
+
+def word(rng):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main():
+    books = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    rng = random.Random(42)
+    with tempfile.TemporaryDirectory() as tmp:
+        with Database(os.path.join(tmp, 'bench.db')) as db:
+            start = time.perf_counter()
+            db.add_books(
+                (f'CAT-{i}', f'C{i}', '2024-01-01', rng.choice(KEYWORDS), None, None,
+                 ' '.join(word(rng) for _ in range(rng.randint(1, 5))), f'{word(rng)} {word(rng)}', 'Publisher', 1)
+                for i in range(books))
+            db.add_book('HUGO', 'C', '2024-01-01', 'roman', None, None, 'Les Misérables', 'Victor Hugo', 'Publisher', 1)
+            db.add_book('ZOLA', 'C', '2024-01-01', 'roman', None, None, 'Germinal', 'Émile Zola', 'Publisher', 1)
+            print(f"{books} books loaded and indexed in {time.perf_counter() - start:.1f}s")
+            conn = db._connect()
+            for table in ('catalog_words', 'catalog_word_trigrams', 'catalog_word_books'):
+                print(f"{table:22} {conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]:>9} rows")
+
+            for query in QUERIES:
+                exact, found = timed(lambda: db.search_livres(query, 50, fuzzy=False), 5)
+                fuzzy, matches = timed(lambda: db.search_livres_fuzzy(query, 50), 5)
+                top = matches[0].title if matches else '-'
+                print(f"{query!r:15} exact {exact * 1e3:>6.1f}ms ({len(found):>2})   "
+                      f"fuzzy {fuzzy * 1e3:>6.1f}ms ({len(matches):>2}, top: {top})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Show EXPLAIN QUERY PLAN and timings for the hot lookups before and after
+the index migration, on a database with ROWS rows per table.
+
+Usage: python benchmarks/bench_indexes.py [rows]
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from migrations import migrate
+
+QUERIES = [
+    ('get_loan',
+     'SELECT * FROM loans WHERE subscriber_id = ? AND catalog_code = ?',
+     lambda n: (random.randrange(n), f'CAT-{random.randrange(n)}')),
+    ('get_waitlist_by_book',
+     'SELECT * FROM waitlist WHERE catalog_code = ? ORDER BY request_date ASC',
+     lambda n: (f'CAT-{random.randrange(n)}',)),
+    ('has_waitlist_request',
+     'SELECT * FROM waitlist WHERE catalog_code = ? AND request_date <= ?',
+     lambda n: (f'CAT-{random.randrange(n)}', '2024-06-01')),
+    ('get_current_subscription',
+     '''SELECT us.*, sp.name, sp.description
+        FROM user_subscriptions us
+        JOIN subscription_plans sp ON us.plan_id = sp.id
+        WHERE us.username = ? AND us.end_date > ? AND us.payment_status = 'abonne'
+        ORDER BY us.end_date DESC LIMIT 1''',
+     lambda n: (f'user{random.randrange(n)}', '2024-06-01 00:00:00')),
+    ('get_loans_by_subscriber',
+     '''SELECT lo.loan_date, lo.return_date, l.title, l.author, u.username, u.id
+        FROM loans lo
+        JOIN livres l ON lo.catalog_code = l.code_catalogue
+        JOIN users u ON lo.subscriber_id = u.id
+        WHERE lo.subscriber_id = ?''',
+     lambda n: (random.randrange(n),)),
+]
+
+
+def populate(conn, rows):
+    def day(i):
+        return f'2024-{1 + i % 12:02d}-{1 + i % 28:02d}'
+
+    conn.execute('BEGIN')
+    conn.executemany(
+        'INSERT INTO users (username, password, email) VALUES (?, ?, ?)',
+        ((f'user{i}', 'x', f'user{i}@library.com') for i in range(rows)))
+    conn.execute("INSERT INTO subscription_plans (id, name, price, duration_months) VALUES (1, 'Basic Plan', 9.99, 1)")
+    conn.executemany(
+        'INSERT INTO user_subscriptions (username, plan_id, start_date, end_date, payment_status) VALUES (?, 1, ?, ?, ?)',
+        ((f'user{i}', day(i) + ' 00:00:00', day(i + 5) + ' 00:00:00', 'abonne') for i in range(rows)))
+    conn.executemany(
+        '''INSERT INTO livres (code_catalogue, cote, date_acquisition, title, author, publisher)
+           VALUES (?, ?, ?, ?, ?, ?)''',
+        ((f'CAT-{i}', f'C{i}', day(i), f'Title {i}', f'Author {i % 5000}', 'Publisher') for i in range(rows)))
+    conn.executemany(
+        'INSERT INTO loans (subscriber_id, catalog_code, loan_date, return_date) VALUES (?, ?, ?, ?)',
+        ((i, f'CAT-{(i * 7919) % rows}', day(i), day(i + 15)) for i in range(rows)))
+    conn.executemany(
+        'INSERT INTO waitlist (subscriber_id, catalog_code, request_date) VALUES (?, ?, ?)',
+        ((i, f'CAT-{(i * 104729) % rows}', day(i)) for i in range(rows)))
+    conn.commit()
+
+
+def report(conn, rows, label, repeat):
+    print(f'=== {label} ===')
+    for name, sql, params in QUERIES:
+        plan = conn.execute('EXPLAIN QUERY PLAN ' + sql, params(rows)).fetchall()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(sql, params(rows)).fetchall()
+        elapsed = (time.perf_counter() - start) / repeat
+        print(f'{name}: {elapsed * 1e3:.3f} ms/query')
+        for row in plan:
+            print(f'    {row[-1]}')
+    print()
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    random.seed(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, 'bench.db'))
+        migrate(conn, target=1)
+        start = time.perf_counter()
+        populate(conn, rows)
+        print(f'Populated {rows} rows per table in {time.perf_counter() - start:.1f}s\n')
+
+        report(conn, rows, 'before (schema version 1)', repeat=3)
+        start = time.perf_counter()
+        migrate(conn)
+        print(f'Index migration took {time.perf_counter() - start:.1f}s\n')
+        conn.execute('ANALYZE')
+        report(conn, rows, 'after (latest schema)', repeat=1000)
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
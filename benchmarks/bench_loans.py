@@ -0,0 +1,119 @@
+"""
+Concurrent add_loan stress test: client threads hammer a small pool of
+titles and patrons, then the loan, availability and copy tables are
+checked for duplicates and drift.
+
+Usage: python benchmarks/bench_loans.py [seconds] [clients]
+"""
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from database import Database
+
+TITLES = 200
+COPIES = 5
+PATRONS = 500
+
+
+def populate(db):
+    db.add_books(
+        (f'CAT-{i}', f'C{i}', '2024-01-01', 'roman', None, None, f'Title {i}', f'Author {i}', 'Publisher', COPIES)
+        for i in range(TITLES))
+
+
+def check(db):
+    """
+    Return a list of invariant violations
+    """
+    conn = db._connect()
+    problems = []
+    duplicates = conn.execute('''
+        SELECT COUNT(*) FROM (
+            SELECT 1 FROM loans WHERE returned_at IS NULL
+            GROUP BY subscriber_id, catalog_code HAVING COUNT(*) > 1
+        )
+    ''').fetchone()[0]
+    if duplicates:
+        problems.append(f'{duplicates} duplicate open loans')
+    drift = conn.execute('''
+        SELECT COUNT(*) FROM livres l
+        WHERE l.available_copies != l.quantity - (
+            SELECT COUNT(*) FROM loans lo WHERE lo.catalog_code = l.code_catalogue AND lo.returned_at IS NULL
+        ) OR l.available_copies < 0
+    ''').fetchone()[0]
+    if drift:
+        problems.append(f'{drift} titles with a wrong available_copies')
+    copies = conn.execute('''
+        SELECT
+            (SELECT COUNT(*) FROM exemplaires WHERE status = 'on_loan'),
+            (SELECT COUNT(*) FROM loans WHERE returned_at IS NULL),
+            (SELECT COUNT(*) FROM loans WHERE returned_at IS NULL AND copy_id IS NULL)
+    ''').fetchone()
+    if copies[0] != copies[1] or copies[2]:
+        problems.append(f'{copies[0]} copies on loan for {copies[1]} open loans, {copies[2]} without a copy')
+    return problems
+
+
+def run(clients, seconds, use_writer):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'bench.db'))
+        populate(db)
+        if use_writer:
+            db.start_writer()
+        stop = threading.Event()
+        counts = {'ok': 0, 'refused': 0, 'returns': 0}
+        lock = threading.Lock()
+
+        def client():
+            rng = random.Random()
+            today = date.today()
+            ok = refused = returns = 0
+            while not stop.is_set():
+                patron, code = rng.randrange(PATRONS), f'CAT-{rng.randrange(TITLES)}'
+                if rng.random() < 0.3:
+                    returns += db.return_loan(patron, code, today)
+                elif db.add_loan(patron, code, today, today + timedelta(days=15)):
+                    ok += 1
+                else:
+                    refused += 1
+            with lock:
+                counts['ok'] += ok
+                counts['refused'] += refused
+                counts['returns'] += returns
+
+        threads = [threading.Thread(target=client) for _ in range(clients)]
+        # add_loan prints every refusal; keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            for thread in threads:
+                thread.start()
+            time.sleep(seconds)
+            stop.set()
+            for thread in threads:
+                thread.join()
+        problems = check(db)
+        db.close()
+    return counts, problems
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    print(f"{clients} clients, {TITLES} titles x {COPIES} copies, {PATRONS} patrons, {seconds:g}s per run")
+    for use_writer in (False, True):
+        counts, problems = run(clients, seconds, use_writer)
+        label = 'writer service' if use_writer else 'direct'
+        print(f"{label:15} loans/s {counts['ok'] / seconds:>7.0f}   refused/s {counts['refused'] / seconds:>7.0f}   "
+              f"returns/s {counts['returns'] / seconds:>7.0f}   {'; '.join(problems) or 'no duplicates, counts consistent'}")
+
+
+if __name__ == '__main__':
+    main()
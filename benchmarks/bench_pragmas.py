@@ -0,0 +1,91 @@
+"""
+Mixed read/write load under each pragma profile: reader threads look up
+books and loans while a writer thread records loans.
+
+Usage: python benchmarks/bench_pragmas.py [seconds] [readers]
+"""
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from database import Database
+from pragma_profiles import PROFILES
+
+BOOKS = 50_000
+USERS = 2_000
+
+
+def populate(db):
+    db.add_books(
+        (f'CAT-{i}', f'C{i}', '2024-01-01', 'roman', None, None, f'Title {i}', f'Author {i % 997}', 'Publisher', 3)
+        for i in range(BOOKS))
+    with db.transaction():
+        for i in range(USERS):
+            db.add_user(f'user{i}', 'salt:hash', f'user{i}@library.com')
+
+
+def run_profile(profile, seconds, readers):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'bench.db'), profile=profile)
+        populate(db)
+        stop = threading.Event()
+        counts = {'reads': 0, 'writes': 0, 'failed_writes': 0}
+        lock = threading.Lock()
+
+        def reader():
+            rng = random.Random()
+            n = 0
+            while not stop.is_set():
+                db.get_book(rng.randrange(1, BOOKS))
+                db.get_loans_by_subscriber(rng.randrange(1, USERS))
+                n += 2
+            with lock:
+                counts['reads'] += n
+
+        def writer():
+            rng = random.Random()
+            today = date.today()
+            ok = failed = 0
+            while not stop.is_set():
+                if db.add_loan(rng.randrange(1, USERS), f'CAT-{rng.randrange(BOOKS)}', today, today + timedelta(days=15)):
+                    ok += 1
+                else:
+                    failed += 1
+            with lock:
+                counts['writes'] += ok
+                counts['failed_writes'] += failed
+
+        threads = [threading.Thread(target=reader) for _ in range(readers)]
+        threads.append(threading.Thread(target=writer))
+        # add_loan prints duplicate/lock messages; keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            for thread in threads:
+                thread.start()
+            time.sleep(seconds)
+            stop.set()
+            for thread in threads:
+                thread.join()
+        db.close()
+    return counts
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    readers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    print(f"{readers} readers + 1 writer for {seconds:g}s per profile")
+    for profile in PROFILES:
+        counts = run_profile(profile, seconds, readers)
+        print(f"{profile:10} reads/s {counts['reads'] / seconds:>9.0f}   "
+              f"writes/s {counts['writes'] / seconds:>7.0f}   failed writes {counts['failed_writes']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Build time, memory and lookup latency of the title/author prefix index.
+
+Usage: python benchmarks/bench_prefix_index.py [books]
+"""
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from database import Database
+
+SYLLABLES = ('ma', 'ri', 'lé', 'on', 'ca', 'vé', 'tor', 'hu', 'go', 'zo', 'la', 'bal', 'zac', 'mi', 'sé', 'ra')
+PREFIXES = ('h', 'hu', 'hug', 'mar', 'zola', 'vé', 'xyz')
+
+
+def word(rng):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    books = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    rng = random.Random(42)
+    with tempfile.TemporaryDirectory() as tmp:
+        with Database(os.path.join(tmp, 'bench.db')) as db:
+            db.add_books(
+                (f'CAT-{i}', f'C{i}', '2024-01-01', 'roman', None, None,
+                 ' '.join(word(rng) for _ in range(rng.randint(1, 5))), f'{word(rng)} {word(rng)}', 'Publisher', 1)
+                for i in range(books))
+
+            # Timed build first; tracemalloc slows allocation down, so the
+            # traced build is a second one
+            stats = db.build_prefix_index().stats()
+            db.prefix_index = None
+            gc.collect()
+            tracemalloc.start()
+            index = db.build_prefix_index()
+            traced = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            print(f"{books} books: {stats['words']} words, {stats['postings']} postings, "
+                  f"built in {stats['build_seconds']:.2f}s")
+            print(f"memory: {stats['bytes'] / 2 ** 20:.1f} MiB by getsizeof, {traced / 2 ** 20:.1f} MiB traced")
+
+            for prefix in PREFIXES:
+                complete = timed(lambda: db.autocomplete(prefix), 1000)
+                lookup = timed(lambda: index.lookup(prefix), 1000)
+                print(f"{prefix!r:8} complete {complete * 1e6:>6.1f}us   lookup(50) {lookup * 1e6:>6.1f}us")
+
+            added = timed(lambda: db.add_book('NEW', 'C', '2024-01-01', 'roman', None, None,
+                                              'Quatrevingt-treize', 'Victor Hugo', 'Publisher', 1), 100)
+            print(f"add_book with index upkeep {added * 1e3:.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Memory and fetch time of catalog rows as plain tuples, sqlite3.Row, dicts
+and records.Book.
+
+Usage: python benchmarks/bench_rows.py [books]
+"""
+import gc
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from database import Database
+from records import Book
+
+
+def dict_factory(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+FACTORIES = [
+    ('tuple', None),
+    ('sqlite3.Row', sqlite3.Row),
+    ('dict', dict_factory),
+    ('Book', Book.from_row),
+]
+
+
+def measure(conn, factory):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    cursor = conn.cursor()
+    cursor.row_factory = factory
+    rows = cursor.execute('SELECT * FROM livres').fetchall()
+    elapsed = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return len(rows), size, elapsed
+
+
+def main():
+    books = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        with Database(path) as db:
+            db.add_books(
+                (f'CAT-{i}', f'C{i}', '2024-01-01', 'roman', None, None, f'Title {i}', f'Author {i % 997}', 'Publisher', 1)
+                for i in range(books))
+        conn = sqlite3.connect(path)
+        print(f"{books} livres rows; 'extra' is the cost over the plain tuples")
+        baseline = None
+        for name, factory in FACTORIES:
+            count, size, elapsed = measure(conn, factory)
+            baseline = size if baseline is None else baseline
+            print(f"{name:12} {size / count:>5.0f} bytes/row (extra {(size - baseline) / count:>4.0f})   "
+                  f"{size / 2 ** 20:>6.1f} MiB   fetch {elapsed:.2f}s")
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""
+Bulk import of catalog records from CSV or JSONL files.
+
+Usage: python catalog_import.py books.csv [--db library.db] [--batch-size 5000]
+                                          [--rejects rejects.jsonl] [--profile bulk-load]
+
+Field names match the livres columns (code_catalogue, cote, date_acquisition,
+title, author, publisher, mote_cles, id_editeur, id_theme, quantity).
+"""
+import argparse
+import csv
+import json
+import os
+import time
+from datetime import datetime
+
+from database import Database, INSERT_BOOK_COLUMNS
+from pragma_profiles import PROFILES
+
+REQUIRED_FIELDS = ('code_catalogue', 'cote', 'date_acquisition', 'title', 'author', 'publisher')
+
+
+class ImportStats:
+    def __init__(self):
+        self.read = 0
+        self.imported = 0
+        self.rejected = 0
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.read / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (f"{self.read} read, {self.imported} imported, {self.rejected} rejected "
+                f"in {self.elapsed:.1f}s ({self.rows_per_second:.0f} rows/s)")
+
+
+def read_records(path, file_format=None):
+    """
+    Yield (line_number, record dict) from a CSV or JSONL file, one at a time
+    """
+    if file_format is None:
+        file_format = 'jsonl' if os.path.splitext(path)[1].lower() in ('.jsonl', '.json') else 'csv'
+    with open(path, newline='', encoding='utf-8') as f:
+        if file_format == 'csv':
+            # Line 1 is the header
+            for line_number, record in enumerate(csv.DictReader(f), start=2):
+                yield line_number, record
+        elif file_format == 'jsonl':
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield line_number, {'_error': f"invalid JSON: {e}", '_raw': line.rstrip('\n')}
+                    continue
+                yield line_number, record
+        else:
+            raise ValueError(f"Unsupported import format: {file_format}")
+
+
+def validate_record(record):
+    """
+    Return the livres row tuple for a record, or raise ValueError
+    """
+    if not isinstance(record, dict):
+        raise ValueError("record is not an object")
+    if '_error' in record:
+        raise ValueError(record['_error'])
+
+    values = {}
+    for column in INSERT_BOOK_COLUMNS:
+        value = record.get(column)
+        if isinstance(value, str):
+            value = value.strip()
+        values[column] = value if value not in ('', None) else None
+
+    missing = [field for field in REQUIRED_FIELDS if values[field] is None]
+    if missing:
+        raise ValueError(f"missing required fields: {', '.join(missing)}")
+
+    try:
+        datetime.strptime(str(values['date_acquisition']), '%Y-%m-%d')
+    except ValueError:
+        raise ValueError(f"date_acquisition must be YYYY-MM-DD, got {values['date_acquisition']!r}")
+
+    quantity = values['quantity']
+    try:
+        quantity = 1 if quantity is None else int(quantity)
+    except (TypeError, ValueError):
+        raise ValueError(f"quantity must be an integer, got {quantity!r}")
+    if quantity < 1:
+        raise ValueError(f"quantity must be at least 1, got {quantity}")
+    values['quantity'] = quantity
+
+    return tuple(values[column] for column in INSERT_BOOK_COLUMNS)
+
+
+def import_catalog(db, path, batch_size=5000, rejects_path=None, file_format=None, progress=None):
+    """
+    Stream a catalog file into livres in batches of batch_size rows.
+
+    Each batch is inserted with one executemany and committed on its own,
+    so the write lock is only held for one batch at a time; index, FTS and
+    fuzzy-search word maintenance is deferred until the whole file is
+    loaded. Batches committed before an interruption stay, and the deferred
+    indexes are restored on the next start (see
+    Database.deferred_catalog_indexes).
+    Rejected rows are written to rejects_path as JSON lines with the line
+    number and reason. progress, if given, is called with the ImportStats
+    after every batch. Returns the final ImportStats.
+    """
+    stats = ImportStats()
+    rejects = open(rejects_path, 'w', encoding='utf-8') if rejects_path else None
+
+    def reject(line_number, record, reason):
+        stats.rejected += 1
+        if rejects:
+            rejects.write(json.dumps({'line': line_number, 'error': reason, 'record': record}, ensure_ascii=False) + '\n')
+
+    def flush(batch):
+        inserted = db.add_books([row for _, _, row in batch])
+        if inserted is None:
+            # Isolate the offending rows instead of losing the whole batch
+            for line_number, record, row in batch:
+                if db.add_books([row]) is None:
+                    reject(line_number, record, "database rejected row")
+                else:
+                    stats.imported += 1
+        else:
+            stats.imported += inserted
+        if progress:
+            progress(stats)
+
+    try:
+        with db.deferred_catalog_indexes():
+            batch = []
+            for line_number, record in read_records(path, file_format):
+                stats.read += 1
+                try:
+                    batch.append((line_number, record, validate_record(record)))
+                except ValueError as e:
+                    reject(line_number, record, str(e))
+                    continue
+                if len(batch) >= batch_size:
+                    flush(batch)
+                    batch = []
+            if batch:
+                flush(batch)
+    finally:
+        if rejects:
+            rejects.close()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import books into the library catalog")
+    parser.add_argument('path', help="CSV or JSONL file to import")
+    parser.add_argument('--db', default='library.db', help="database file (default: library.db)")
+    parser.add_argument('--format', choices=('csv', 'jsonl'), help="input format (default: from extension)")
+    parser.add_argument('--batch-size', type=int, default=5000, help="rows per committed batch (default: 5000)")
+    parser.add_argument('--rejects', help="write rejected rows to this JSONL file")
+    parser.add_argument('--profile', default='bulk-load', choices=sorted(PROFILES), help="pragma profile (default: bulk-load)")
+    args = parser.parse_args()
+
+    with Database(args.db, profile=args.profile) as db:
+        stats = import_catalog(
+            db, args.path, batch_size=args.batch_size, rejects_path=args.rejects,
+            file_format=args.format, progress=lambda s: print(f"\r{s}", end='', flush=True))
+    print(f"\rImport finished: {stats}")
+
+
+if __name__ == '__main__':
+    main()
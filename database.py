@@ -1,95 +1,445 @@
+import functools
+import re
 import sqlite3
-from datetime import datetime, timedelta
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from cache import MISSING, TTLCache
+from events import EventBus
+from migrations import SYNC_COPIES_SQL, migrate
+from pragma_profiles import DEFAULT_PROFILE, apply_profile
+from prefix_index import TOKEN_RE, PrefixIndex
+from records import Book, Loan, Subscription, SubscriptionPlan, User, WaitlistEntry, from_epoch_day
+from trigram_index import fuzzy_words, index_book_words, trigrams
+from write_behind import WriteBehindBuffer
+from write_queue import WriterService, backoff_delay, is_lock_error
+
+# Columns a caller supplies when adding a book
+INSERT_BOOK_COLUMNS = (
+    'code_catalogue', 'cote', 'date_acquisition', 'mote_cles', 'id_editeur',
+    'id_theme', 'title', 'author', 'publisher', 'quantity',
+)
+
+# Every livres column, in table order; available_copies is maintained by
+# triggers (see migration 4)
+BOOK_COLUMNS = ('id',) + INSERT_BOOK_COLUMNS + ('available_copies',)
+
+# Attempts made by add_loan when another connection holds the write lock
+LOAN_LOCK_RETRIES = 5
+
+# bm25 column weights for livres_fts: title, author, mote_cles, publisher
+FTS_WEIGHTS = (10.0, 5.0, 2.0, 1.0)
+
+# Published on Database.events with catalog_code and count when copies of a
+# title become free: its quantity was raised or one of its loans ended.
+# Handlers run inside the transaction making the change.
+COPIES_AVAILABLE = 'copies_available'
+
+# Typo-tolerant search (search_livres_fuzzy): minimum trigram similarity of
+# a catalog word to a query word, and per query word the number of similar
+# words and book links looked at, which bound the query on any catalog size
+FUZZY_THRESHOLD = 0.3
+FUZZY_WORDS_PER_TERM = 20
+FUZZY_MAX_POSTINGS = 20000
+
+
+def parse_quantity(quantity):
+    """
+    Return a book quantity as an int >= 0, or raise ValueError.
+
+    Forms pass the entry text as it was typed; anything but a whole number
+    would be stored as TEXT in livres.quantity.
+    """
+    if isinstance(quantity, str):
+        quantity = quantity.strip()
+    elif isinstance(quantity, bool) or not isinstance(quantity, int):
+        raise ValueError(f"quantity must be a whole number, got {quantity!r}")
+    try:
+        value = int(quantity)
+    except ValueError:
+        raise ValueError(f"quantity must be a whole number, got {quantity!r}")
+    if value < 0:
+        raise ValueError(f"quantity cannot be negative, got {value}")
+    return value
+
+
+def format_acquisition_date(value):
+    """
+    Return an acquisition date as the 'YYYY-MM-DD' text livres stores.
+
+    livres.date_acquisition is kept as entered rather than as an epoch day
+    like the loan dates, so a date object must not reach the registered
+    sqlite3 adapter; other values are passed through unchanged.
+    """
+    if isinstance(value, date):
+        return value.strftime('%Y-%m-%d')
+    return value
+
+
+def build_fts_query(search_term):
+    """
+    Turn free text into an FTS5 MATCH expression.
+
+    Each word becomes a quoted prefix term ("hug"* matches "Hugo") so that
+    user input can never be parsed as FTS syntax. Returns None when the text
+    contains no searchable word.
+    """
+    words = re.findall(r'\w+', search_term or '')
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def mutation(method):
+    """
+    Mark a Database method as a write.
+
+    When the writer service is running, calls from other threads are queued
+    to the writer thread and the caller waits for the group commit. Inside
+    a caller's own transaction() the write runs directly, since the writer
+    could not take the lock that transaction holds.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        writer = self.writer
+        if writer is None or writer.owns_current_thread() or self._in_transaction():
+            return method(self, *args, **kwargs)
+        return writer.submit(method, self, *args, **kwargs).result()
+    return wrapper
+
 
 class Database:
-    def __init__(self, db_path='library.db'):
+    def __init__(self, db_path='library.db', timeout=5.0, cache_size=256, cache_ttl=60.0, profile=DEFAULT_PROFILE):
         """
         Initialize the database with necessary tables
         """
         self.db_path = db_path
+        self.timeout = timeout
+        # Named PRAGMA set from pragma_profiles applied to every connection
+        self.profile = profile
+        # One long-lived connection per thread, keyed by the owning thread
+        self._local = threading.local()
+        self._connections = {}
+        self._connections_lock = threading.Lock()
+        self._closed = False
+        # Optional single-writer service, see start_writer()
+        self.writer = None
+        # Optional write-behind buffer for last-login times, see start_write_behind()
+        self.login_buffer = None
+        # Read-through caches for the per-session user/subscription lookups
+        self.user_cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self.subscription_cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        # Stock-change notifications, see COPIES_AVAILABLE
+        self.events = EventBus()
+        # Optional title/author autocomplete index, see build_prefix_index()
+        self.prefix_index = None
+        # Set while deferred_catalog_indexes() leaves word indexing to the end
+        self.catalog_indexes_deferred = False
         self.init_database()
 
+    def _open_connection(self):
+        """
+        Open and configure a new connection for the calling thread
+        """
+        # Connections never leave their thread; check_same_thread is relaxed
+        # only so close() can shut them all down from the main thread.
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False)
+        try:
+            apply_profile(conn, self.profile, self.db_path)
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    def _connect(self):
+        """
+        Return the calling thread's connection, opening it on first use
+        """
+        if self._closed:
+            raise sqlite3.ProgrammingError("Database has been closed")
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            try:
+                # Raises ProgrammingError if the connection was closed under us
+                conn.in_transaction
+                return conn
+            except sqlite3.ProgrammingError:
+                self._discard(conn)
+
+        conn = self._open_connection()
+        thread = threading.current_thread()
+        with self._connections_lock:
+            self._prune_dead_threads()
+            self._connections[thread] = conn
+        self._local.conn = conn
+        return conn
+
+    def _release(self, conn):
+        """
+        Hand a connection back after a method is done with it.
+
+        Any transaction left open by a failed statement is rolled back so the
+        next caller starts clean; a connection that cannot even roll back is
+        considered broken and is replaced on the next call. Inside
+        transaction() the connection is left alone for the block to finish.
+        """
+        if self._in_transaction() or not conn.in_transaction:
+            return
+        try:
+            conn.rollback()
+        except sqlite3.Error as e:
+            print(f"Discarding broken database connection: {e}")
+            self._discard(conn)
+
+    def _commit(self, conn):
+        """
+        Commit a method's writes, unless it is part of an enclosing
+        transaction(), which then commits everything once at the end
+        """
+        if not self._in_transaction():
+            conn.commit()
+
+    def _in_transaction(self):
+        return getattr(self._local, 'depth', 0) > 0
+
+    def _after_commit(self, callback):
+        """
+        Run callback once the calling thread's writes are committed: now when
+        no transaction() is open, otherwise after its outermost COMMIT.
+
+        Cache invalidation goes through here. Invalidating before the commit
+        would let another thread re-cache the old row in between.
+        """
+        if self._in_transaction():
+            self._local.after_commit.append(callback)
+        else:
+            callback()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Run a block of Database calls as one atomic unit of work.
+
+        The outermost block starts a BEGIN IMMEDIATE transaction on the
+        calling thread's connection; every Database method called inside it
+        joins that transaction instead of committing on its own, and a single
+        COMMIT happens when the block exits. Nested blocks use savepoints.
+        An exception rolls the block back and is re-raised. Callbacks
+        registered with _after_commit run after the outermost COMMIT and are
+        dropped with the block that registered them if it rolls back.
+        """
+        conn = self._connect()
+        depth = getattr(self._local, 'depth', 0)
+        savepoint = f'tx_{depth}'
+        conn.execute('BEGIN IMMEDIATE' if depth == 0 else f'SAVEPOINT {savepoint}')
+        if depth == 0:
+            self._local.after_commit = []
+        pending = len(self._local.after_commit)
+        self._local.depth = depth + 1
+        try:
+            yield conn
+        except BaseException:
+            self._local.depth = depth
+            del self._local.after_commit[pending:]
+            try:
+                if depth == 0:
+                    conn.rollback()
+                else:
+                    conn.execute(f'ROLLBACK TO {savepoint}')
+                    conn.execute(f'RELEASE {savepoint}')
+            except sqlite3.Error as rollback_error:
+                print(f"Error rolling back transaction: {rollback_error}")
+                if depth == 0:
+                    self._discard(conn)
+            raise
+        else:
+            self._local.depth = depth
+            if depth == 0:
+                try:
+                    conn.commit()
+                except sqlite3.Error:
+                    self._local.after_commit = []
+                    self._release(conn)
+                    raise
+                callbacks, self._local.after_commit = self._local.after_commit, []
+                for callback in callbacks:
+                    callback()
+            else:
+                conn.execute(f'RELEASE {savepoint}')
+
+    def _cache_result(self, cache, key, value):
+        """
+        Store a lookup result, unless it was read inside an open transaction
+        that may still roll back
+        """
+        if not self._in_transaction():
+            cache.set(key, value)
+
+    def cache_stats(self):
+        """
+        Hit/miss counters and sizes of the lookup caches
+        """
+        return {'users': self.user_cache.stats(), 'subscriptions': self.subscription_cache.stats()}
+
+    def _discard(self, conn):
+        """
+        Forget and close a connection so the thread reconnects on next use
+        """
+        if getattr(self._local, 'conn', None) is conn:
+            self._local.conn = None
+        with self._connections_lock:
+            for thread, owned in list(self._connections.items()):
+                if owned is conn:
+                    del self._connections[thread]
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def _prune_dead_threads(self):
+        """
+        Close connections whose owning thread has exited (lock must be held)
+        """
+        for thread, conn in list(self._connections.items()):
+            if not thread.is_alive():
+                del self._connections[thread]
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+
+    def start_writer(self, **options):
+        """
+        Route all writes through a single group-committing writer thread.
+
+        Useful when several terminals share one database file: writes from
+        this process stop competing with each other for the lock. options
+        are passed to WriterService (max_batch, max_delay, max_pending, ...).
+        """
+        if self.writer is None:
+            self.writer = WriterService(self, **options)
+        return self.writer
+
+    def stop_writer(self):
+        """
+        Flush pending writes and go back to writing on the caller's thread
+        """
+        writer, self.writer = self.writer, None
+        if writer is not None:
+            writer.stop()
+
+    def submit_write(self, method, *args, **kwargs):
+        """
+        Run a write method, e.g. db.submit_write(db.add_loan, ...), and
+        return a Future for its result. The Future is already resolved when
+        no writer service is running.
+        """
+        if self.writer is not None:
+            return self.writer.submit(method, *args, **kwargs)
+        future = Future()
+        try:
+            future.set_result(method(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def start_write_behind(self, interval=5.0, max_pending=500):
+        """
+        Buffer record_login() calls and write them in batches every
+        interval seconds or once max_pending users are waiting
+        """
+        if self.login_buffer is None:
+            self.login_buffer = WriteBehindBuffer(
+                self.update_last_logins, interval=interval, max_pending=max_pending, name='login-write-behind')
+        return self.login_buffer
+
+    def build_prefix_index(self, chunk_size=5000):
+        """
+        Build the in-memory title/author prefix index from a streaming scan
+        of livres and start keeping it up to date from add_book(s),
+        update_book and delete_book. Returns the index; see its stats().
+
+        The index is installed before the scan starts, so catalog writes
+        made meanwhile reach it; it queues them and replays them once the
+        scanned rows are in.
+        """
+        index = PrefixIndex(loading=True)
+        self.prefix_index = index
+        return index.load(self.iter_books(columns=('id', 'title', 'author'), chunk_size=chunk_size))
+
+    def autocomplete(self, text, limit=10):
+        """
+        Complete the last word of text from indexed titles and authors,
+        without touching the database. Returns [] until build_prefix_index()
+        has run.
+        """
+        index = self.prefix_index
+        words = list(TOKEN_RE.finditer(text))
+        if index is None or not words or words[-1].end() != len(text):
+            return []
+        head = text[:words[-1].start()]
+        return [head + word for word in index.complete(words[-1].group(), limit)]
+
+    def flush_write_behind(self):
+        """
+        Write out buffered low-value writes now
+        """
+        if self.login_buffer is not None:
+            self.login_buffer.flush()
+
+    def close(self):
+        """
+        Close every connection held by this Database
+        """
+        # Buffered writes go out first, through the writer if it is running
+        buffer, self.login_buffer = self.login_buffer, None
+        if buffer is not None:
+            buffer.close()
+        self.stop_writer()
+        self._closed = True
+        with self._connections_lock:
+            connections = list(self._connections.values())
+            self._connections.clear()
+        for conn in connections:
+            try:
+                if conn.in_transaction:
+                    conn.rollback()
+                conn.close()
+            except sqlite3.Error as e:
+                print(f"Error closing database connection: {e}")
+        self._local = threading.local()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
     def init_database(self):
         """
-        Create all tables for the library management system
-        """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        # Create tables for library management system
-        cursor.executescript('''
-        -- Existing tables...
-
-        -- Table: users
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            is_admin BOOLEAN DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            last_login TIMESTAMP
-        );
-
-        -- Table: subscription_plans
-        CREATE TABLE IF NOT EXISTS subscription_plans (
-            id INTEGER PRIMARY KEY,
-            name TEXT UNIQUE NOT NULL,
-            price REAL NOT NULL,
-            duration_months INTEGER NOT NULL,
-            description TEXT
-        );
-
-        -- Table: user_subscriptions
-        CREATE TABLE IF NOT EXISTS user_subscriptions (
-            id INTEGER PRIMARY KEY,
-            username TEXT NOT NULL,
-            plan_id INTEGER NOT NULL,
-            start_date DATETIME NOT NULL,
-            end_date DATETIME NOT NULL,
-            payment_status TEXT NOT NULL,
-            FOREIGN KEY (username) REFERENCES users (username),
-            FOREIGN KEY (plan_id) REFERENCES subscription_plans (id)
-        );
-
-        -- Table: livres
-        CREATE TABLE IF NOT EXISTS livres (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            code_catalogue TEXT NOT NULL,
-            cote TEXT NOT NULL,
-            date_acquisition DATE NOT NULL,
-            mote_cles TEXT,
-            id_editeur TEXT,
-            id_theme TEXT,
-            title TEXT NOT NULL,
-            author TEXT NOT NULL,
-            publisher TEXT NOT NULL,
-            quantity INTEGER NOT NULL DEFAULT 1
-        );
-
-        -- Table: loans
-        CREATE TABLE IF NOT EXISTS loans (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            subscriber_id INTEGER NOT NULL,
-            catalog_code TEXT NOT NULL,
-            loan_date DATE NOT NULL,
-            return_date DATE NOT NULL,
-            is_renewed BOOLEAN DEFAULT 0,
-            FOREIGN KEY (subscriber_id) REFERENCES users (id),
-            FOREIGN KEY (catalog_code) REFERENCES livres (code_catalogue)
-        );
-
-        -- Table: waitlist
-        CREATE TABLE IF NOT EXISTS waitlist (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            subscriber_id INTEGER NOT NULL,
-            catalog_code TEXT NOT NULL,
-            request_date DATE NOT NULL,
-            priority_date DATE,
-            FOREIGN KEY (subscriber_id) REFERENCES users (id),
-            FOREIGN KEY (catalog_code) REFERENCES livres (code_catalogue)
-        );
-        ''')
+        Bring the schema up to date and seed the default subscription plans
+        """
+        conn = self._connect()
+        cursor = conn.cursor()
+
+        # Create tables and indexes, applying any pending schema migrations
+        try:
+            applied = migrate(conn)
+            if applied:
+                print(f"Applied database migrations: {applied}")
+        except sqlite3.Error as e:
+            print(f"Error migrating database: {e}")
+            self._release(conn)
+            raise
+
+        # Finish a bulk load that was interrupted before it restored the
+        # catalog indexes (see deferred_catalog_indexes)
+        if cursor.execute('SELECT 1 FROM deferred_catalog_objects LIMIT 1').fetchone():
+            print("Restoring catalog indexes left deferred by an interrupted import")
+            with self.transaction() as tx:
+                self._restore_catalog_indexes(tx)
 
         # Insert default subscription plans if not exists
         plans = [
@@ -103,14 +453,15 @@ class Database:
             VALUES (?, ?, ?, ?)
         ''', plans)
 
-        conn.commit()
-        conn.close()
+        self._commit(conn)
+        self._release(conn)
 
+    @mutation
     def add_user(self, username, hashed_password, email, is_admin=False):
         """
         Add a new user to the system
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         try:
             cursor.execute('''
@@ -118,34 +469,43 @@ class Database:
                 (username, password, email, is_admin) 
                 VALUES (?, ?, ?, ?)
             ''', (username, hashed_password, email, is_admin))
-            conn.commit()
+            self._commit(conn)
             return True
         except sqlite3.IntegrityError:
             print(f"User {username} or email already exists.")
             return False
         finally:
-            conn.close()
+            self._after_commit(lambda: self.user_cache.invalidate(username))
+            self._release(conn)
 
     def get_user(self, username):
         """
-        Retrieve a user by username
+        Retrieve a user by username (cached, see user_cache)
         """
-        conn = sqlite3.connect(self.db_path)
+        user = self.user_cache.get(username)
+        if user is not MISSING:
+            return user
+        conn = self._connect()
         cursor = conn.cursor()
+        cursor.row_factory = User.from_row
         try:
             cursor.execute('SELECT * FROM users WHERE username = ?', (username,))
-            return cursor.fetchone()
+            user = cursor.fetchone()
+            if user is not None:
+                self._cache_result(self.user_cache, username, user)
+            return user
         except sqlite3.Error as e:
             print(f"Error retrieving user: {e}")
             return None
         finally:
-            conn.close()
+            self._release(conn)
 
+    @mutation
     def update_last_login(self, username):
         """
         Update the last login timestamp for a user
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         try:
             cursor.execute('''
@@ -153,18 +513,61 @@ class Database:
                 SET last_login = ? 
                 WHERE username = ?
             ''', (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), username))
-            conn.commit()
+            self._commit(conn)
         except sqlite3.Error as e:
             print(f"Error updating last login: {e}")
         finally:
-            conn.close()
+            self._after_commit(lambda: self.user_cache.invalidate(username))
+            self._release(conn)
+
+    def record_login(self, username):
+        """
+        Note that a user logged in now. Goes through the write-behind buffer
+        when one is running (see start_write_behind), so logins never wait
+        on the database.
+        """
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        if self.login_buffer is not None:
+            self.login_buffer.put(username, now)
+        else:
+            self.update_last_logins({username: now})
+
+    @mutation
+    def update_last_logins(self, logins):
+        """
+        Set last_login for many users in one transaction.
+
+        logins maps username to a '%Y-%m-%d %H:%M:%S' timestamp.
+        """
+        conn = self._connect()
+        cursor = conn.cursor()
+        try:
+            cursor.executemany('''
+                UPDATE users 
+                SET last_login = ? 
+                WHERE username = ?
+            ''', [(timestamp, username) for username, timestamp in logins.items()])
+            self._commit(conn)
+            return True
+        except sqlite3.Error as e:
+            print(f"Error updating last logins: {e}")
+            return False
+        finally:
+            usernames = list(logins)
+
+            def invalidate():
+                for username in usernames:
+                    self.user_cache.invalidate(username)
+            self._after_commit(invalidate)
+            self._release(conn)
 
     def get_subscription_plans(self):
         """
         Retrieve all subscription plans
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
+        cursor.row_factory = SubscriptionPlan.from_row
         try:
             cursor.execute('SELECT * FROM subscription_plans')
             return cursor.fetchall()
@@ -172,13 +575,19 @@ class Database:
             print(f"Error retrieving subscription plans: {e}")
             return []
         finally:
-            conn.close()
+            self._release(conn)
 
+    @mutation
     def add_subscription(self, username, plan_id, start_date, end_date, payment_status):
         """
-        Add a new user subscription
+        Add a new user subscription. start_date and end_date are datetimes
+        (or 'YYYY-MM-DD HH:MM:SS' text).
         """
-        conn = sqlite3.connect(self.db_path)
+        if isinstance(start_date, str):
+            start_date = datetime.fromisoformat(start_date)
+        if isinstance(end_date, str):
+            end_date = datetime.fromisoformat(end_date)
+        conn = self._connect()
         cursor = conn.cursor()
         try:
             cursor.execute('''
@@ -186,20 +595,30 @@ class Database:
                 (username, plan_id, start_date, end_date, payment_status) 
                 VALUES (?, ?, ?, ?, ?)
             ''', (username, plan_id, start_date, end_date, payment_status))
-            conn.commit()
+            self._commit(conn)
             return True
         except sqlite3.Error as e:
             print(f"Error adding subscription: {e}")
             return False
         finally:
-            conn.close()
+            # Callers pass either a username or a user id here and to
+            # get_current_subscription, so drop every cached subscription
+            self._after_commit(self.subscription_cache.clear)
+            self._release(conn)
 
     def get_current_subscription(self, username):
         """
-        Get the current active subscription for a user
+        Get the current active subscription for a user (cached, see
+        subscription_cache; "no subscription" is cached too)
         """
-        conn = sqlite3.connect(self.db_path)
+        now = datetime.now()
+        subscription = self.subscription_cache.get(username)
+        # A cached subscription that has since ended must not be served
+        if subscription is not MISSING and (subscription is None or subscription.end_date > now):
+            return subscription
+        conn = self._connect()
         cursor = conn.cursor()
+        cursor.row_factory = Subscription.from_row
         try:
             cursor.execute('''
                 SELECT us.*, sp.name, sp.description 
@@ -208,40 +627,166 @@ class Database:
                 WHERE us.username = ? AND us.end_date > ? AND us.payment_status = 'abonne'
                 ORDER BY us.end_date DESC
                 LIMIT 1
-            ''', (username, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+            ''', (username, now))
             
-            return cursor.fetchone()
+            subscription = cursor.fetchone()
+            self._cache_result(self.subscription_cache, username, subscription)
+            return subscription
         except sqlite3.Error as e:
             print(f"Error retrieving subscription: {e}")
             return None
         finally:
-            conn.close()
+            self._release(conn)
 
+    @mutation
     def add_book(self, code_catalogue, cote, date_acquisition, mote_cles=None, id_editeur=None, id_theme=None, title=None, author=None, publisher=None, quantity=1):
         """
         Add a new book to the system
         """
-        conn = sqlite3.connect(self.db_path)
+        try:
+            quantity = parse_quantity(quantity)
+        except ValueError as e:
+            print(f"Error adding book: {e}")
+            return False
+        date_acquisition = format_acquisition_date(date_acquisition)
+        conn = self._connect()
         cursor = conn.cursor()
         try:
-            cursor.execute('''
-                INSERT INTO livres (code_catalogue, cote, date_acquisition, mote_cles, id_editeur, id_theme, title, author, publisher, quantity)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (code_catalogue, cote, date_acquisition, mote_cles, id_editeur, id_theme, title, author, publisher, quantity))
-            conn.commit()
+            with self.transaction():
+                cursor.execute('''
+                    INSERT INTO livres (code_catalogue, cote, date_acquisition, mote_cles, id_editeur, id_theme, title, author, publisher, quantity)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (code_catalogue, cote, date_acquisition, mote_cles, id_editeur, id_theme, title, author, publisher, quantity))
+                book_id = cursor.lastrowid
+                cursor.execute(SYNC_COPIES_SQL, (book_id - 1, book_id))
+                index_book_words(cursor, book_id - 1, book_id)
+            if self.prefix_index is not None:
+                self.prefix_index.add(book_id, title, author)
             return True
         except sqlite3.Error as e:
             print(f"Error adding book: {e}")
             return False
         finally:
-            conn.close()
+            self._release(conn)
+
+    @mutation
+    def add_books(self, books):
+        """
+        Add many books in a single transaction.
+
+        books is an iterable of tuples in INSERT_BOOK_COLUMNS order. Their
+        exemplaires are generated in one set-based pass. Returns the number
+        of rows inserted, or None if the batch was rolled back (including
+        when a row's quantity is not a whole number >= 0). Inside an
+        enclosing transaction() only this batch's savepoint is rolled back.
+        Under deferred_catalog_indexes() the fuzzy-search words are indexed
+        once at the end of the load instead.
+        """
+        position = INSERT_BOOK_COLUMNS.index('quantity')
+        date_position = INSERT_BOOK_COLUMNS.index('date_acquisition')
+        books = ((*book[:date_position], format_acquisition_date(book[date_position]),
+                  *book[date_position + 1:position], parse_quantity(book[position]), *book[position + 1:])
+                 for book in books)
+        conn = self._connect()
+        cursor = conn.cursor()
+        try:
+            with self.transaction():
+                cursor.execute('SELECT COALESCE(MAX(id), 0) FROM livres')
+                last_id = cursor.fetchone()[0]
+                cursor.executemany(f'''
+                    INSERT INTO livres ({', '.join(INSERT_BOOK_COLUMNS)})
+                    VALUES ({', '.join('?' * len(INSERT_BOOK_COLUMNS))})
+                ''', books)
+                added = cursor.rowcount
+                cursor.execute(SYNC_COPIES_SQL, (last_id, None))
+                if not self.catalog_indexes_deferred:
+                    index_book_words(cursor, last_id)
+            if self.prefix_index is not None:
+                self.prefix_index.add_many(
+                    cursor.execute('SELECT id, title, author FROM livres WHERE id > ?', (last_id,)))
+            return added
+        except (sqlite3.Error, ValueError) as e:
+            print(f"Error adding books: {e}")
+            return None
+        finally:
+            self._release(conn)
+
+    @contextmanager
+    def deferred_catalog_indexes(self):
+        """
+        Suspend catalog index and FTS maintenance for a bulk load.
+
+        The per-row FTS and availability insert triggers and the
+        code_catalogue index are dropped on entry, and add_books stops
+        indexing fuzzy-search words. On exit the rows added meanwhile are
+        indexed, their availability set and their words indexed in one pass
+        each, and the triggers and index are recreated.
+
+        Writes made in the block commit as usual, so other terminals only
+        wait for one batch at a time. The dropped objects are recorded in
+        deferred_catalog_objects in the same transaction that drops them;
+        if the process dies before exit, the next init_database() finishes
+        the job (another terminal starting mid-load does so too, which only
+        costs the load its speed-up).
+        """
+        deferred = ('livres_fts_after_insert', 'livres_available_after_insert', 'idx_livres_code_catalogue')
+        with self.transaction() as conn:
+            after_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM livres').fetchone()[0]
+            saved = conn.execute(f'''
+                SELECT name, type, sql FROM sqlite_master
+                WHERE name IN ({', '.join('?' * len(deferred))})
+            ''', deferred).fetchall()
+            conn.executemany('''
+                INSERT OR IGNORE INTO deferred_catalog_objects (name, type, sql, after_id)
+                VALUES (?, ?, ?, ?)
+            ''', [(*row, after_id) for row in saved])
+            for name, kind, _ in saved:
+                conn.execute(f'DROP {kind.upper()} IF EXISTS {name}')
+        self.catalog_indexes_deferred = True
+        try:
+            yield
+        finally:
+            self.catalog_indexes_deferred = False
+            with self.transaction() as conn:
+                self._restore_catalog_indexes(conn, after_id)
+
+    def _restore_catalog_indexes(self, conn, after_id=None):
+        """
+        Bring livres rows with id > after_id up to date after a bulk load
+        and recreate the objects recorded in deferred_catalog_objects (with
+        after_id None, the load they were dropped for). Run inside
+        transaction().
+        """
+        deferred = conn.execute('SELECT sql, after_id FROM deferred_catalog_objects').fetchall()
+        if deferred:
+            after_id = min(row[1] for row in deferred)
+            # The FTS insert trigger has been gone since after_id; if the
+            # records are already gone, whoever removed them caught up
+            conn.execute('''
+                INSERT INTO livres_fts (rowid, title, author, mote_cles, publisher)
+                SELECT id, title, author, mote_cles, publisher FROM livres WHERE id > ?
+            ''', (after_id,))
+            for sql, _ in deferred:
+                conn.execute(sql)
+            conn.execute('DELETE FROM deferred_catalog_objects')
+        elif after_id is None:
+            return
+        # Both passes are idempotent, so running them after a recovery is harmless
+        conn.execute('''
+            UPDATE livres SET available_copies = quantity - (
+                SELECT COUNT(*) FROM loans
+                WHERE loans.catalog_code = livres.code_catalogue AND loans.returned_at IS NULL
+            ) WHERE id > ?
+        ''', (after_id,))
+        index_book_words(conn.cursor(), after_id)
 
     def get_books(self):
         """
         Retrieve all books from the system
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
+        cursor.row_factory = Book.from_row
         try:
             cursor.execute('SELECT * FROM livres')
             books = cursor.fetchall()
@@ -250,14 +795,151 @@ class Database:
             print(f"Error retrieving books: {e}")
             return []
         finally:
-            conn.close()
+            self._release(conn)
     
+    def get_books_page(self, after_id=0, limit=50, columns=None):
+        """
+        Retrieve one page of books with id greater than after_id, in id order.
+
+        Pass the id of the last row as after_id to get the next page. columns
+        restricts the selected livres columns (default: all, like get_books);
+        id is prepended to each row when it is not one of them.
+        """
+        return self._fetch_books_page('livres', '', (), after_id, limit, columns)
+
+    def search_livres_page(self, search_term, after_id=0, limit=50, columns=None):
+        """
+        Retrieve one page of search_livres matches with id greater than
+        after_id, in id order (see search_livres_ranked_page for relevance
+        order).
+        """
+        match = build_fts_query(search_term)
+        if match is None:
+            return []
+        return self._fetch_books_page(
+            'livres_fts JOIN livres ON livres.id = livres_fts.rowid',
+            'livres_fts MATCH ? AND', (match,), after_id, limit, columns)
+
+    def search_livres_ranked_page(self, search_term, after_id=0, limit=50, columns=None):
+        """
+        Retrieve one page of search_livres matches in bm25 order, best
+        first, continuing after the book after_id (0 for the first page).
+
+        Pages are keyset-paginated on (score, id): the statement rescores
+        after_id itself, so callers pass only the id of the last row, as with
+        search_livres_page. Every page scores all matches, so prefer
+        iter_search_livres to walk a whole result set. If after_id no longer
+        matches, the page is empty.
+        """
+        match = build_fts_query(search_term)
+        if match is None:
+            return []
+        select = self._book_select(columns)
+        conn = self._connect()
+        cursor = conn.cursor()
+        if columns is None:
+            cursor.row_factory = Book.from_row
+        after = ''
+        if after_id:
+            after = 'WHERE (ranked.score, ranked.id) > ((SELECT score FROM ranked WHERE id = ?), ?)'
+        try:
+            cursor.execute(f'''
+                WITH ranked AS (
+                    SELECT rowid AS id, bm25(livres_fts, ?, ?, ?, ?) AS score
+                    FROM livres_fts WHERE livres_fts MATCH ?
+                )
+                SELECT {select} FROM ranked JOIN livres ON livres.id = ranked.id
+                {after}
+                ORDER BY ranked.score, ranked.id
+                LIMIT ?
+            ''', (*FTS_WEIGHTS, match, *((after_id, after_id) if after_id else ()), limit))
+            return cursor.fetchall()
+        except sqlite3.Error as e:
+            print(f"Error searching books: {e}")
+            return []
+        finally:
+            self._release(conn)
+
+    def iter_books(self, columns=None, chunk_size=500):
+        """
+        Yield every book, reading chunk_size rows at a time
+        """
+        return self._iter_pages(
+            lambda after_id: self.get_books_page(after_id, chunk_size, columns), columns)
+
+    def iter_search_livres(self, search_term, columns=None, chunk_size=500):
+        """
+        Yield every search_livres match in id order, chunk_size rows at a time
+        """
+        return self._iter_pages(
+            lambda after_id: self.search_livres_page(search_term, after_id, chunk_size, columns), columns)
+
+    def _iter_pages(self, fetch_page, columns):
+        """
+        Drive a keyset page function until it returns an empty page.
+
+        No cursor or connection is held while the caller consumes a chunk,
+        so the generator can be paused indefinitely.
+        """
+        # _fetch_books_page prepends id when the caller did not ask for it
+        extra_id = columns is not None and 'id' not in columns
+        id_index = 0 if columns is None or extra_id else list(columns).index('id')
+        after_id = 0
+        while True:
+            page = fetch_page(after_id)
+            if not page:
+                return
+            after_id = page[-1][id_index]
+            if extra_id:
+                yield from (row[1:] for row in page)
+            else:
+                yield from page
+
+    def _book_select(self, columns):
+        """
+        SELECT list for the given livres columns (all when None), with id
+        prepended when it is not one of them
+        """
+        if columns is None:
+            return 'livres.*'
+        unknown = set(columns) - set(BOOK_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown book columns: {sorted(unknown)}")
+        select = ', '.join(f'livres.{column}' for column in columns)
+        if 'id' not in columns:
+            select = 'livres.id, ' + select
+        return select
+
+    def _fetch_books_page(self, source, where, params, after_id, limit, columns):
+        """
+        Run a keyset-paginated SELECT over livres
+        """
+        select = self._book_select(columns)
+        conn = self._connect()
+        cursor = conn.cursor()
+        if columns is None:
+            cursor.row_factory = Book.from_row
+        try:
+            cursor.execute(f'''
+                SELECT {select} FROM {source}
+                WHERE {where} livres.id > ?
+                ORDER BY livres.id
+                LIMIT ?
+            ''', (*params, after_id, limit))
+            return cursor.fetchall()
+        except sqlite3.Error as e:
+            print(f"Error retrieving books: {e}")
+            return []
+        finally:
+            self._release(conn)
+
     def get_book(self, book_id):
         """
         Retrieve a book by its ID
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
+        cursor.row_factory = Book.from_row
         try:
             cursor.execute('SELECT * FROM livres WHERE id = ?', (book_id,))
             return cursor.fetchone()
@@ -265,68 +947,207 @@ class Database:
             print(f"Error retrieving book: {e}")
             return None
         finally:
-            conn.close()
+            self._release(conn)
 
+    @mutation
     def delete_book(self, book_id):
         """
         Delete a book from the system
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         try:
-            cursor.execute('DELETE FROM livres WHERE id = ?', (book_id,))
-            conn.commit()
+            cursor.execute('DELETE FROM livres WHERE id = ? RETURNING title, author', (book_id,))
+            deleted = cursor.fetchall()
+            self._commit(conn)
+            if deleted and self.prefix_index is not None:
+                self.prefix_index.remove(book_id, *deleted[0])
             return True
         except sqlite3.Error as e:
             print(f"Error deleting book: {e}")
             return False
         finally:
-            conn.close()
+            self._release(conn)
 
+    @mutation
     def update_book(self, book_id, title, author, category, quantity, cote):
         """
         Update a book's information
         """
-        conn = sqlite3.connect(self.db_path)
+        try:
+            quantity = parse_quantity(quantity)
+        except ValueError as e:
+            print(f"Error updating book: {e}")
+            return False
+        conn = self._connect()
         cursor = conn.cursor()
         try:
-            cursor.execute('''
-                UPDATE livres
-                SET title = ?, author = ?, mote_cles = ?, quantity = ?, cote = ?
-                WHERE id = ?
-            ''', (title, author, category, quantity, cote, book_id))
-            conn.commit()
+            with self.transaction():
+                # A legacy TEXT quantity counts as 0, as in SYNC_COPIES_SQL
+                cursor.execute('''
+                    SELECT code_catalogue, CAST(quantity AS INTEGER), title, author FROM livres WHERE id = ?
+                ''', (book_id,))
+                old = cursor.fetchone()
+                cursor.execute('''
+                    UPDATE livres
+                    SET title = ?, author = ?, mote_cles = ?, quantity = ?, cote = ?
+                    WHERE id = ?
+                ''', (title, author, category, quantity, cote, book_id))
+                # Add copies up to the new quantity, or withdraw free surplus ones
+                cursor.execute(SYNC_COPIES_SQL, (book_id - 1, book_id))
+                cursor.execute('''
+                    DELETE FROM exemplaires WHERE livre_id = ? AND copy_number > ? AND status = 'available'
+                ''', (book_id, quantity))
+                cursor.execute('DELETE FROM catalog_word_books WHERE livre_id = ?', (book_id,))
+                index_book_words(cursor, book_id - 1, book_id)
+                if old and quantity > old[1]:
+                    self.events.publish(COPIES_AVAILABLE, catalog_code=old[0], count=quantity - old[1])
+            if old and self.prefix_index is not None:
+                self.prefix_index.remove(book_id, old[2], old[3])
+                self.prefix_index.add(book_id, title, author)
             return True
         except sqlite3.Error as e:
             print(f"Error updating book: {e}")
             return False
         finally:
-            conn.close()
+            self._release(conn)
             
-    def search_livres(self, search_term):
+    def search_livres(self, search_term, limit=None, fuzzy=True):
         """
-        Search for books by title, author, publisher, or theme
+        Search for books by title, author, publisher, or theme.
+
+        Every word is matched as a prefix against the FTS index and results
+        are ranked by bm25, best match first. When nothing matches and fuzzy
+        is true, the typo-tolerant search_livres_fuzzy results are returned.
         """
-        conn = sqlite3.connect(self.db_path)
+        match = build_fts_query(search_term)
+        if match is None:
+            return []
+        conn = self._connect()
         cursor = conn.cursor()
+        cursor.row_factory = Book.from_row
         try:
             cursor.execute('''
-                SELECT * FROM livres
-                WHERE title LIKE ? OR author LIKE ? OR mote_cles LIKE ? OR publisher LIKE ?
-            ''', (f"%{search_term}%", f"%{search_term}%", f"%{search_term}%", f"%{search_term}%"))
+                SELECT l.* FROM livres_fts
+                JOIN livres l ON l.id = livres_fts.rowid
+                WHERE livres_fts MATCH ?
+                ORDER BY bm25(livres_fts, ?, ?, ?, ?), l.id
+                LIMIT ?
+            ''', (match, *FTS_WEIGHTS, -1 if limit is None else limit))
             books = cursor.fetchall()
+        except sqlite3.Error as e:
+            print(f"Error searching books: {e}")
+            return []
+        finally:
+            self._release(conn)
+        if books or not fuzzy:
             return books
+        return self.search_livres_fuzzy(search_term, 50 if limit is None else limit)
+
+    def search_livres_fuzzy(self, search_term, limit=50, columns=None, threshold=FUZZY_THRESHOLD):
+        """
+        Typo-tolerant search: "victor hugot" or "emile zolla" still find
+        the books.
+
+        Each accent- and case-folded query word is compared with the catalog
+        vocabulary by trigram similarity (shared trigrams / all distinct
+        trigrams of both words) and a book scores, per query word, the
+        similarity of its closest word; books are ranked by the total, best
+        first. The work is bounded by the vocabulary's trigram postings and
+        by FUZZY_WORDS_PER_TERM words and FUZZY_MAX_POSTINGS book links per
+        query word, not by the number of books. columns works as in
+        get_books_page.
+        """
+        terms = fuzzy_words(search_term)
+        if not terms:
+            return []
+        select = self._book_select(columns)
+        conn = self._connect()
+        cursor = conn.cursor()
+        try:
+            scores = {}
+            for term in terms:
+                grams = trigrams(term)
+                size = len(grams)
+                # Words that are too short or too long to reach threshold are
+                # skipped before their trigrams are counted
+                cursor.execute(f'''
+                    SELECT w.id, COUNT(*) * 1.0 / (?1 + w.trigram_count - COUNT(*)) AS similarity
+                    FROM catalog_word_trigrams t
+                    JOIN catalog_words w ON w.id = t.word_id
+                    WHERE t.trigram IN ({', '.join(f'?{n}' for n in range(4, 4 + size))})
+                      AND w.trigram_count BETWEEN ?1 * ?2 AND ?1 / ?2
+                    GROUP BY w.id
+                    HAVING similarity >= ?2
+                    ORDER BY similarity DESC
+                    LIMIT ?3
+                ''', (size, threshold, FUZZY_WORDS_PER_TERM, *grams))
+                similar_words = cursor.fetchall()
+                best = {}
+                for word_id, similarity in similar_words:
+                    cursor.execute('''
+                        SELECT livre_id FROM catalog_word_books WHERE word_id = ? LIMIT ?
+                    ''', (word_id, FUZZY_MAX_POSTINGS - len(best)))
+                    for (book_id,) in cursor:
+                        best.setdefault(book_id, similarity)
+                    if len(best) >= FUZZY_MAX_POSTINGS:
+                        break
+                for book_id, similarity in best.items():
+                    scores[book_id] = scores.get(book_id, 0.0) + similarity
+            ranked = sorted(scores, key=lambda book_id: (-scores[book_id], book_id))[:limit]
+            if not ranked:
+                return []
+            if columns is None:
+                cursor.row_factory = Book.from_row
+            cursor.execute(f'''
+                WITH ranked (id, position) AS (VALUES {', '.join(['(?, ?)'] * len(ranked))})
+                SELECT {select} FROM ranked JOIN livres ON livres.id = ranked.id
+                ORDER BY ranked.position
+            ''', [value for position, book_id in enumerate(ranked) for value in (book_id, position)])
+            return cursor.fetchall()
         except sqlite3.Error as e:
             print(f"Error searching books: {e}")
             return []
         finally:
-            conn.close()
+            self._release(conn)
+
+    def search_livres_snippets(self, search_term, limit=50, marker=('[', ']')):
+        """
+        Search like search_livres but return highlighted matches.
+
+        Each row is (id, title, author, snippet) where matched words in the
+        title and author are wrapped in marker and snippet is a short excerpt
+        of the best-matching column.
+        """
+        match = build_fts_query(search_term)
+        if match is None:
+            return []
+        start, end = marker
+        conn = self._connect()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('''
+                SELECT rowid,
+                       highlight(livres_fts, 0, ?, ?),
+                       highlight(livres_fts, 1, ?, ?),
+                       snippet(livres_fts, -1, ?, ?, '...', 12)
+                FROM livres_fts
+                WHERE livres_fts MATCH ?
+                ORDER BY bm25(livres_fts, ?, ?, ?, ?)
+                LIMIT ?
+            ''', (start, end, start, end, start, end, match, *FTS_WEIGHTS, limit))
+            return cursor.fetchall()
+        except sqlite3.Error as e:
+            print(f"Error searching books: {e}")
+            return []
+        finally:
+            self._release(conn)
 
     def get_borrowed_books_with_users(self):
         """
         Get all borrowed books with user information
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         try:
             cursor.execute('''
@@ -341,14 +1162,15 @@ class Database:
             print(f"Error retrieving borrowed books with users: {e}")
             return []
         finally:
-            conn.close()
+            self._release(conn)
 
     def get_user_by_id(self, user_id):
         """
         Retrieve a user by their ID
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
+        cursor.row_factory = User.from_row
         try:
             cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
             return cursor.fetchone()
@@ -356,47 +1178,234 @@ class Database:
             print(f"Error retrieving user: {e}")
             return None
         finally:
-            conn.close()
+            self._release(conn)
 
+    @mutation
     def add_loan(self, subscriber_id: int, catalog_code: str, loan_date: datetime.date, return_date: datetime.date):
         """
-        Add a new loan record
+        Add a new loan record and check out one free exemplaire for it.
+        Fails when the subscriber already has the book or no copy is free.
+
+        The loan is a single conditional INSERT: it only inserts while the
+        title has an available copy, the partial unique index rejects a
+        second open loan of the same book, and triggers decrement the count
+        and claim the copy in the same statement. Lock contention is retried
+        with backoff, up to LOAN_LOCK_RETRIES times, outside transactions.
+        """
+        for attempt in range(LOAN_LOCK_RETRIES + 1):
+            conn = self._connect()
+            cursor = conn.cursor()
+            try:
+                cursor.execute('''
+                    INSERT INTO loans (subscriber_id, catalog_code, loan_date, return_date)
+                    SELECT ?1, ?2, ?3, ?4
+                    WHERE EXISTS (SELECT 1 FROM livres WHERE code_catalogue = ?2 AND available_copies > 0)
+                    ON CONFLICT DO NOTHING
+                ''', (subscriber_id, catalog_code, loan_date, return_date))
+                if cursor.rowcount == 1:
+                    self._commit(conn)
+                    return True
+                cursor.execute('''
+                    SELECT 1 FROM loans WHERE subscriber_id = ? AND catalog_code = ? AND returned_at IS NULL
+                ''', (subscriber_id, catalog_code))
+                if cursor.fetchone():
+                    print(f"Loan already exists for subscriber {subscriber_id} and book {catalog_code}")
+                else:
+                    print(f"No copy of book {catalog_code} available")
+                return False
+            except sqlite3.IntegrityError as e:
+                # Raised by the availability or copy-claim triggers
+                print(f"No copy of book {catalog_code} available: {e}")
+                return False
+            except sqlite3.Error as e:
+                if is_lock_error(e) and attempt < LOAN_LOCK_RETRIES and not self._in_transaction():
+                    time.sleep(backoff_delay(attempt))
+                    continue
+                print(f"Error adding loan record: {e}")
+                return False
+            finally:
+                self._release(conn)
+
+    @mutation
+    def checkin_copy(self, barcode, returned_at=None):
+        """
+        Check in the exemplaire with this barcode, returning the loan it is
+        on. The loans_after_return trigger frees the copy. Returns False if
+        the copy is not on loan.
         """
-        conn = sqlite3.connect(self.db_path)
+        returned_at = returned_at or datetime.now().date()
+        conn = self._connect()
         cursor = conn.cursor()
         try:
-            cursor.execute('''
-                SELECT * FROM loans WHERE subscriber_id = ? AND catalog_code = ?
-            ''', (subscriber_id, catalog_code))
-            existing_loan = cursor.fetchone()
-            if existing_loan:
-                print(f"Loan already exists for subscriber {subscriber_id} and book {catalog_code}")
-                return False
-            cursor.execute('''
-                INSERT INTO loans (subscriber_id, catalog_code, loan_date, return_date)
-                VALUES (?, ?, ?, ?)
-            ''', (subscriber_id, catalog_code, loan_date.strftime('%Y-%m-%d'), return_date.strftime('%Y-%m-%d')))
-            conn.commit()
-            return True
+            with self.transaction():
+                cursor.execute('''
+                    UPDATE loans SET returned_at = ?
+                    WHERE id = (SELECT loan_id FROM exemplaires WHERE barcode = ?) AND returned_at IS NULL
+                    RETURNING catalog_code
+                ''', (returned_at, barcode))
+                returned = cursor.fetchone()
+                if returned:
+                    self.events.publish(COPIES_AVAILABLE, catalog_code=returned[0], count=1)
+            return returned is not None
         except sqlite3.Error as e:
-            print(f"Error adding loan record: {e}")
+            print(f"Error checking in copy: {e}")
             return False
         finally:
-            conn.close()
+            self._release(conn)
+
+    def get_copies(self, catalog_code):
+        """
+        Get every exemplaire of a title as (id, barcode, status, loan_id)
+        """
+        conn = self._connect()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('''
+                SELECT id, barcode, status, loan_id FROM exemplaires
+                WHERE catalog_code = ? ORDER BY copy_number
+            ''', (catalog_code,))
+            return cursor.fetchall()
+        except sqlite3.Error as e:
+            print(f"Error retrieving copies: {e}")
+            return []
+        finally:
+            self._release(conn)
 
-    def get_loans_by_subscriber(self, subscriber_id: int):
+    def get_due_loans_page(self, due_before, due_from=None, after=(None, 0), limit=500):
         """
-        Get all loans for a subscriber with book and user information
+        Get one page of open loans due before due_before (and on or after
+        due_from when given), ordered by return date then loan id.
+
+        after is the (return_date, id) of the last row of the previous page.
+        Rows are (loan_id, return_date, loan_date, is_renewed, subscriber_id,
+        username, email, catalog_code, title, author), dates as stored epoch
+        days (see records.parse_date).
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         try:
             cursor.execute('''
-                SELECT lo.loan_date, lo.return_date, l.title, l.author, u.username, u.id
+                SELECT lo.id, lo.return_date, lo.loan_date, lo.is_renewed, u.id, u.username, u.email,
+                       lo.catalog_code, l.title, l.author
                 FROM loans lo
+                JOIN users u ON u.id = lo.subscriber_id
+                LEFT JOIN livres l ON l.code_catalogue = lo.catalog_code
+                WHERE lo.returned_at IS NULL
+                  AND lo.return_date < ?1 AND lo.return_date >= ?2
+                  AND (lo.return_date, lo.id) > (coalesce(?3, ?2), ?4)
+                ORDER BY lo.return_date, lo.id
+                LIMIT ?
+            ''', (due_before, due_from or datetime.min.date(), *after, limit))
+            return cursor.fetchall()
+        except sqlite3.Error as e:
+            print(f"Error retrieving due loans: {e}")
+            return []
+        finally:
+            self._release(conn)
+
+    def iter_due_loans(self, due_before, due_from=None, chunk_size=500):
+        """
+        Yield every get_due_loans_page row, chunk_size rows at a time
+        """
+        after = (None, 0)
+        while True:
+            page = self.get_due_loans_page(due_before, due_from, after, chunk_size)
+            if not page:
+                return
+            after = (page[-1][1], page[-1][0])
+            yield from page
+
+    @mutation
+    def return_loan(self, subscriber_id: int, catalog_code: str, returned_at: datetime.date):
+        """
+        Mark the open loan of a book by a subscriber as returned. The
+        loans_after_return trigger gives the copy back. Returns False if
+        there was no open loan.
+        """
+        conn = self._connect()
+        cursor = conn.cursor()
+        try:
+            with self.transaction():
+                cursor.execute('''
+                    UPDATE loans SET returned_at = ?
+                    WHERE subscriber_id = ? AND catalog_code = ? AND returned_at IS NULL
+                ''', (returned_at, subscriber_id, catalog_code))
+                returned = cursor.rowcount
+                if returned:
+                    self.events.publish(COPIES_AVAILABLE, catalog_code=catalog_code, count=returned)
+            return returned > 0
+        except sqlite3.Error as e:
+            print(f"Error returning loan: {e}")
+            return False
+        finally:
+            self._release(conn)
+
+    @mutation
+    def archive_loan_chunk(self, chunk_size=500, returned_before=None):
+        """
+        Move up to chunk_size returned loans, oldest return first, from loans
+        to loans_history in one short transaction. Only loans returned before
+        returned_before are moved when it is given. Returns the number of
+        loans moved, or None on error.
+        """
+        conn = self._connect()
+        cursor = conn.cursor()
+        try:
+            with self.transaction():
+                cursor.execute('''
+                    SELECT id FROM loans
+                    WHERE returned_at IS NOT NULL AND (?1 IS NULL OR returned_at < ?1)
+                    ORDER BY returned_at LIMIT ?2
+                ''', (returned_before, chunk_size))
+                ids = [row[0] for row in cursor.fetchall()]
+                if not ids:
+                    return 0
+                placeholders = ', '.join('?' * len(ids))
+                cursor.execute(f'''
+                    INSERT INTO loans_history
+                    SELECT id, subscriber_id, catalog_code, loan_date, return_date, is_renewed, copy_id, returned_at
+                    FROM loans WHERE id IN ({placeholders})
+                ''', ids)
+                cursor.execute(f'DELETE FROM loans WHERE id IN ({placeholders})', ids)
+            return len(ids)
+        except sqlite3.Error as e:
+            print(f"Error archiving loans: {e}")
+            return None
+        finally:
+            self._release(conn)
+
+    def archive_closed_loans(self, chunk_size=500, returned_before=None, pause=0.0):
+        """
+        Archive every returned loan in chunks of chunk_size.
+
+        Each chunk commits on its own, so the write lock is only held for one
+        chunk at a time and other writers get in between chunks; pause adds
+        a sleep between them. Returns the total number of loans moved.
+        """
+        total = 0
+        while True:
+            moved = self.archive_loan_chunk(chunk_size, returned_before)
+            if not moved:
+                return total
+            total += moved
+            if pause:
+                time.sleep(pause)
+
+    def get_loans_by_subscriber(self, subscriber_id: int, include_history=False):
+        """
+        Get the open loans of a subscriber with book and user information.
+        With include_history, returned and archived loans are included too.
+        """
+        conn = self._connect()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f'''
+                SELECT date(lo.loan_date * 86400, 'unixepoch'), date(lo.return_date * 86400, 'unixepoch'),
+                       l.title, l.author, u.username, u.id
+                FROM {'all_loans' if include_history else 'loans'} lo
                 JOIN livres l ON lo.catalog_code = l.code_catalogue
                 JOIN users u ON lo.subscriber_id = u.id
-                WHERE lo.subscriber_id = ?
+                WHERE lo.subscriber_id = ? {'' if include_history else 'AND lo.returned_at IS NULL'}
             ''', (subscriber_id,))
             loans = cursor.fetchall()
             return loans
@@ -404,35 +1413,39 @@ class Database:
             print(f"Error retrieving loans for subscriber: {e}")
             return []
         finally:
-            conn.close()
+            self._release(conn)
 
-    def get_subscribers_by_book(self, catalog_code: str):
+    def get_subscribers_by_book(self, catalog_code: str, include_history=False):
         """
-        Get all subscribers who have borrowed a book
+        Get the open loans of a book. With include_history, every loan of
+        the book ever recorded, archived or not.
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
+        cursor.row_factory = Loan.from_row
         try:
-            cursor.execute('''
-                SELECT * FROM loans WHERE catalog_code = ?
-            ''', (catalog_code,))
+            if include_history:
+                cursor.execute('SELECT * FROM all_loans WHERE catalog_code = ?', (catalog_code,))
+            else:
+                cursor.execute('SELECT * FROM loans WHERE catalog_code = ? AND returned_at IS NULL', (catalog_code,))
             loans = cursor.fetchall()
             return loans
         except sqlite3.Error as e:
             print(f"Error retrieving subscribers for book: {e}")
             return []
         finally:
-            conn.close()
+            self._release(conn)
 
     def get_loan(self, subscriber_id: int, catalog_code: str):
         """
-        Get a specific loan record
+        Get the open loan of a book by a subscriber
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
+        cursor.row_factory = Loan.from_row
         try:
             cursor.execute('''
-                SELECT * FROM loans WHERE subscriber_id = ? AND catalog_code = ?
+                SELECT * FROM loans WHERE subscriber_id = ? AND catalog_code = ? AND returned_at IS NULL
             ''', (subscriber_id, catalog_code))
             loan = cursor.fetchone()
             return loan
@@ -440,72 +1453,130 @@ class Database:
             print(f"Error retrieving loan: {e}")
             return None
         finally:
-            conn.close()
+            self._release(conn)
 
+    @mutation
     def update_loan_return_date(self, subscriber_id: int, catalog_code: str, new_return_date: datetime.date):
         """
         Update the return date of a loan
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         try:
             cursor.execute('''
-                UPDATE loans SET return_date = ? WHERE subscriber_id = ? AND catalog_code = ?
+                UPDATE loans SET return_date = ?
+                WHERE subscriber_id = ? AND catalog_code = ? AND returned_at IS NULL
             ''', (new_return_date, subscriber_id, catalog_code))
-            conn.commit()
+            self._commit(conn)
             return True
         except sqlite3.Error as e:
             print(f"Error updating loan return date: {e}")
             return False
         finally:
-            conn.close()
+            self._release(conn)
 
+    @mutation
     def update_loan_renewal(self, subscriber_id: int, catalog_code: str, is_renewed: bool):
         """
         Update the renewal status of a loan
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         try:
             cursor.execute('''
-                UPDATE loans SET is_renewed = ? WHERE subscriber_id = ? AND catalog_code = ?
+                UPDATE loans SET is_renewed = ?
+                WHERE subscriber_id = ? AND catalog_code = ? AND returned_at IS NULL
             ''', (is_renewed, subscriber_id, catalog_code))
-            conn.commit()
+            self._commit(conn)
             return True
         except sqlite3.Error as e:
             print(f"Error updating loan renewal status: {e}")
             return False
         finally:
-            conn.close()
+            self._release(conn)
 
+    @mutation
+    def renew_loans(self, days: int, subscriber_id: int = None, catalog_code: str = None):
+        """
+        Renew every eligible open loan, optionally only a subscriber's and/or
+        only one book's, by days in one set-based pass.
+
+        A loan is eligible if it was not renewed before and nobody is on the
+        waitlist for its book. Returns one (loan_id, subscriber_id,
+        catalog_code, return_date, outcome) row per open loan considered,
+        outcome being 'renewed', 'already_renewed' or 'waitlisted' and
+        return_date the new date for renewed loans. Returns None on error.
+        """
+        # Only the given filters go into the SQL, so one subscriber's loan of
+        # one book is a lookup in idx_loans_open_subscriber_code, not a scan
+        filters = [(column, value) for column, value in (('subscriber_id', subscriber_id), ('catalog_code', catalog_code))
+                   if value is not None]
+        scope = ''.join(f' AND loans.{column} = ?' for column, _ in filters)
+        scope_params = [value for _, value in filters]
+        conn = self._connect()
+        cursor = conn.cursor()
+        try:
+            with self.transaction():
+                cursor.execute(f'''
+                    SELECT loans.id, loans.subscriber_id, loans.catalog_code, loans.return_date,
+                           CASE WHEN loans.is_renewed THEN 'already_renewed'
+                                WHEN EXISTS (SELECT 1 FROM waitlist w WHERE w.catalog_code = loans.catalog_code)
+                                THEN 'waitlisted' END
+                    FROM loans
+                    WHERE loans.returned_at IS NULL{scope}
+                    ORDER BY loans.id
+                ''', scope_params)
+                report = cursor.fetchall()
+                cursor.execute(f'''
+                    UPDATE loans SET return_date = return_date + ?, is_renewed = 1
+                    WHERE loans.returned_at IS NULL AND NOT loans.is_renewed{scope}
+                      AND NOT EXISTS (SELECT 1 FROM waitlist w WHERE w.catalog_code = loans.catalog_code)
+                    RETURNING id, return_date
+                ''', (days, *scope_params))
+                renewed = dict(cursor.fetchall())
+            return [
+                (loan_id, subscriber, code, from_epoch_day(renewed[loan_id]), 'renewed') if loan_id in renewed
+                else (loan_id, subscriber, code, from_epoch_day(return_date), outcome)
+                for loan_id, subscriber, code, return_date, outcome in report
+            ]
+        except sqlite3.Error as e:
+            print(f"Error renewing loans: {e}")
+            return None
+        finally:
+            self._release(conn)
+
+    @mutation
     def add_waitlist_request(self, subscriber_id: int, catalog_code: str, request_date: datetime.date):
         """
-        Add a new waitlist request
+        Add a subscriber to the back of a book's waitlist. Returns False if
+        they are already on it.
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         try:
             cursor.execute('''
                 INSERT INTO waitlist (subscriber_id, catalog_code, request_date)
                 VALUES (?, ?, ?)
+                ON CONFLICT (subscriber_id, catalog_code) DO NOTHING
             ''', (subscriber_id, catalog_code, request_date))
-            conn.commit()
-            return True
+            self._commit(conn)
+            return cursor.rowcount == 1
         except sqlite3.Error as e:
             print(f"Error adding waitlist request: {e}")
             return False
         finally:
-            conn.close()
+            self._release(conn)
 
     def get_waitlist_by_book(self, catalog_code: str):
         """
         Get all waitlist requests for a book
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
+        cursor.row_factory = WaitlistEntry.from_row
         try:
             cursor.execute('''
-                SELECT * FROM waitlist WHERE catalog_code = ? ORDER BY request_date ASC
+                SELECT * FROM waitlist WHERE catalog_code = ? ORDER BY request_date, id
             ''', (catalog_code,))
             waitlist = cursor.fetchall()
             return waitlist
@@ -513,67 +1584,157 @@ class Database:
             print(f"Error retrieving waitlist for book: {e}")
             return []
         finally:
-            conn.close()
+            self._release(conn)
+
+    def peek_waitlist(self, catalog_code: str):
+        """
+        Get the waitlist request at the front of a book's queue, or None
+        """
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.row_factory = WaitlistEntry.from_row
+        try:
+            cursor.execute('''
+                SELECT * FROM waitlist WHERE catalog_code = ? AND priority_date IS NULL
+                ORDER BY request_date, id LIMIT 1
+            ''', (catalog_code,))
+            return cursor.fetchone()
+        except sqlite3.Error as e:
+            print(f"Error peeking waitlist: {e}")
+            return None
+        finally:
+            self._release(conn)
+
+    @mutation
+    def claim_next_waitlist(self, catalog_code: str, priority_date: datetime.date):
+        """
+        Give priority to the patron at the front of a book's queue and
+        return their waitlist row, or None if nobody is waiting.
+        """
+        claimed = self.claim_waitlist(catalog_code, priority_date, 1)
+        return claimed[0] if claimed else None
+
+    @mutation
+    def claim_waitlist(self, catalog_code: str, priority_date: datetime.date, count: int):
+        """
+        Give priority to the first count patrons waiting for a book and
+        return their waitlist rows in queue order.
+
+        The pick and the update are one statement, so two desks claiming at
+        the same time always get different patrons.
+        """
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.row_factory = WaitlistEntry.from_row
+        try:
+            cursor.execute('''
+                UPDATE waitlist SET priority_date = ?
+                WHERE id IN (
+                    SELECT id FROM waitlist WHERE catalog_code = ? AND priority_date IS NULL
+                    ORDER BY request_date, id LIMIT ?
+                )
+                RETURNING *
+            ''', (priority_date, catalog_code, count))
+            claimed = sorted(cursor.fetchall(), key=lambda entry: (entry[3], entry.id))
+            self._commit(conn)
+            return claimed
+        except sqlite3.Error as e:
+            print(f"Error claiming waitlist requests: {e}")
+            return []
+        finally:
+            self._release(conn)
+
+    def get_waitlist_position(self, subscriber_id: int, catalog_code: str):
+        """
+        Get a patron's 1-based place in a book's queue, or None if they are
+        not waiting for it.
+
+        The patron's entry is found through the unique index and the entries
+        ahead are counted inside idx_waitlist_queue, which covers the count
+        (see migration 14), without touching the table.
+        """
+        conn = self._connect()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('''
+                SELECT (
+                    SELECT COUNT(*) FROM waitlist ahead
+                    WHERE ahead.catalog_code = me.catalog_code AND ahead.priority_date IS NULL
+                      AND (ahead.request_date, ahead.id) <= (me.request_date, me.id)
+                )
+                FROM waitlist me
+                WHERE me.subscriber_id = ? AND me.catalog_code = ? AND me.priority_date IS NULL
+            ''', (subscriber_id, catalog_code))
+            row = cursor.fetchone()
+            return row[0] if row else None
+        except sqlite3.Error as e:
+            print(f"Error retrieving waitlist position: {e}")
+            return None
+        finally:
+            self._release(conn)
 
+    @mutation
     def remove_waitlist_request(self, subscriber_id: int, catalog_code: str):
         """
         Remove a waitlist request
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         try:
             cursor.execute('''
                 DELETE FROM waitlist WHERE subscriber_id = ? AND catalog_code = ?
             ''', (subscriber_id, catalog_code))
-            conn.commit()
+            self._commit(conn)
             return True
         except sqlite3.Error as e:
             print(f"Error removing waitlist request: {e}")
             return False
         finally:
-            conn.close()
+            self._release(conn)
 
+    @mutation
     def update_waitlist_priority(self, subscriber_id: int, catalog_code: str, priority_date: datetime.date):
         """
         Update the priority date of a waitlist request
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         try:
             cursor.execute('''
                 UPDATE waitlist SET priority_date = ? WHERE subscriber_id = ? AND catalog_code = ?
             ''', (priority_date, subscriber_id, catalog_code))
-            conn.commit()
+            self._commit(conn)
             return True
         except sqlite3.Error as e:
             print(f"Error updating waitlist priority: {e}")
             return False
         finally:
-            conn.close()
+            self._release(conn)
 
+    @mutation
     def clear_priority_waitlist(self, catalog_code: str):
         """
         Clear the priority date of all waitlist requests for a book
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         try:
             cursor.execute('''
                 UPDATE waitlist SET priority_date = NULL WHERE catalog_code = ?
             ''', (catalog_code,))
-            conn.commit()
+            self._commit(conn)
             return True
         except sqlite3.Error as e:
             print(f"Error clearing waitlist priority: {e}")
             return False
         finally:
-            conn.close()
+            self._release(conn)
 
     def has_waitlist_request(self, catalog_code: str, loan_date: datetime.date):
         """
         Check if there is a waitlist request for a book during a loan period
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         try:
             cursor.execute('''
@@ -585,4 +1746,4 @@ class Database:
             print(f"Error checking waitlist request: {e}")
             return False
         finally:
-            conn.close()
+            self._release(conn)
@@ -0,0 +1,133 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BackgroundWorker:
+    """
+    Run database and hashing work off the Tk main thread.
+
+    Tk is not thread-safe, so worker threads never touch widgets: finished
+    tasks are put on a queue that the main thread drains with root.after()
+    and only then are the on_success / on_error callbacks called.
+
+    Every task belongs to a channel (e.g. "book_list"). Submitting a new
+    task on a channel makes any older task on it stale: if it has not
+    started it is cancelled, otherwise its result is dropped on arrival.
+    """
+    def __init__(self, root, max_workers=2, poll_interval_ms=20):
+        self.root = root
+        self.poll_interval_ms = poll_interval_ms
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='db-worker')
+        self._results = queue.Queue()
+        self._generations = {}
+        self._futures = {}
+        self._busy_callbacks = {}
+        self._pending = 0
+        self._polling = False
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def submit(self, channel, fn, *args, on_success=None, on_error=None, busy=None, **kwargs):
+        """
+        Run fn(*args, **kwargs) on a worker thread.
+
+        on_success(result) or on_error(exception) is later called on the Tk
+        main thread, unless a newer task was submitted on the same channel.
+        busy(True) is called now and busy(False) once the channel has no
+        current task left. Must be called from the main thread.
+        """
+        if self._shutdown:
+            return None
+        with self._lock:
+            generation = self._generations.get(channel, 0) + 1
+            self._generations[channel] = generation
+        stale = self._futures.get(channel)
+        if stale is not None and stale.cancel():
+            self._pending -= 1
+
+        previous_busy = self._busy_callbacks.get(channel)
+        if previous_busy is not busy:
+            self._call_busy(channel, previous_busy, False)
+        self._busy_callbacks[channel] = busy
+        self._call_busy(channel, busy, True)
+
+        def run():
+            try:
+                outcome = (True, fn(*args, **kwargs))
+            except Exception as e:
+                outcome = (False, e)
+            self._results.put((channel, generation, outcome, on_success, on_error))
+
+        future = self._executor.submit(run)
+        self._futures[channel] = future
+        self._pending += 1
+        self._schedule_poll()
+        return future
+
+    def cancel(self, channel):
+        """
+        Drop whatever task is current on a channel
+        """
+        with self._lock:
+            self._generations[channel] = self._generations.get(channel, 0) + 1
+        future = self._futures.pop(channel, None)
+        if future is not None and future.cancel():
+            self._pending -= 1
+        self._set_idle(channel)
+
+    def is_current(self, channel, generation):
+        with self._lock:
+            return self._generations.get(channel) == generation
+
+    def _schedule_poll(self):
+        if not self._polling and not self._shutdown:
+            self._polling = True
+            self.root.after(self.poll_interval_ms, self._poll)
+
+    def _poll(self):
+        """
+        Deliver finished tasks on the main thread
+        """
+        self._polling = False
+        while True:
+            try:
+                channel, generation, (ok, value), on_success, on_error = self._results.get_nowait()
+            except queue.Empty:
+                break
+            self._pending -= 1
+            if not self.is_current(channel, generation):
+                continue
+            self._futures.pop(channel, None)
+            self._set_idle(channel)
+            callback = on_success if ok else on_error
+            if callback is None:
+                if not ok:
+                    print(f"Background task on {channel} failed: {value!r}")
+                continue
+            try:
+                callback(value)
+            except Exception as e:
+                # Keep draining; one broken page must not stall the others
+                print(f"Error delivering {channel} result: {e!r}")
+        if self._pending > 0:
+            self._schedule_poll()
+
+    def _set_idle(self, channel):
+        self._call_busy(channel, self._busy_callbacks.pop(channel, None), False)
+
+    def _call_busy(self, channel, busy, state):
+        if busy is None:
+            return
+        try:
+            busy(state)
+        except Exception as e:
+            # The page that owned the busy indicator may have been closed
+            print(f"Error updating busy state for {channel}: {e}")
+
+    def shutdown(self):
+        """
+        Stop accepting work and wait for running tasks to finish
+        """
+        self._shutdown = True
+        self._executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,32 @@
+import threading
+
+
+class EventBus:
+    """
+    Minimal in-process publish/subscribe.
+
+    Handlers run synchronously on the publishing thread, in subscription
+    order. Database publishes from inside its own transaction, so whatever
+    a handler writes through the same Database commits or rolls back with
+    the change that raised the event; an exception in a handler propagates
+    to the publisher.
+    """
+    def __init__(self):
+        self._handlers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, event, handler):
+        with self._lock:
+            self._handlers.setdefault(event, []).append(handler)
+
+    def unsubscribe(self, event, handler):
+        with self._lock:
+            handlers = self._handlers.get(event, [])
+            if handler in handlers:
+                handlers.remove(handler)
+
+    def publish(self, event, **payload):
+        with self._lock:
+            handlers = list(self._handlers.get(event, ()))
+        for handler in handlers:
+            handler(**payload)
@@ -1,14 +1,40 @@
 import datetime
-from database import Database
+from database import COPIES_AVAILABLE, Database
+
+LOAN_DAYS = 15
+
 
 class LoanManager:
     def __init__(self, db: Database):
         self.db = db
+        # Promote waiting patrons as soon as copies free up, in the same transaction
+        self.db.events.subscribe(COPIES_AVAILABLE, self.promote_waitlist)
+
+    def promote_waitlist(self, catalog_code: str, count: int):
+        return self.db.claim_waitlist(catalog_code, datetime.date.today(), count)
 
     def create_loan(self, subscriber_id: int, catalog_code: str):
         loan_date = datetime.date.today()
-        return_date = loan_date + datetime.timedelta(days=15)
-        self.db.add_loan(subscriber_id, catalog_code, loan_date, return_date)
+        return_date = loan_date + datetime.timedelta(days=LOAN_DAYS)
+        return self.db.add_loan(subscriber_id, catalog_code, loan_date, return_date)
+
+    def return_loan(self, subscriber_id: int, catalog_code: str):
+        return self.db.return_loan(subscriber_id, catalog_code, datetime.date.today())
+
+    def archive_closed_loans(self, older_than_days: int = 0, chunk_size: int = 500):
+        returned_before = datetime.date.today() - datetime.timedelta(days=older_than_days) if older_than_days else None
+        return self.db.archive_closed_loans(chunk_size, returned_before)
+
+    def iter_overdue(self, as_of: datetime.date = None, chunk_size: int = 500):
+        as_of = as_of or datetime.date.today()
+        return self.db.iter_due_loans(as_of, chunk_size=chunk_size)
+
+    def iter_due_soon(self, days: int = 3, as_of: datetime.date = None, chunk_size: int = 500):
+        as_of = as_of or datetime.date.today()
+        return self.db.iter_due_loans(as_of + datetime.timedelta(days=days + 1), as_of, chunk_size)
+
+    def get_loan_history(self, subscriber_id: int):
+        return self.db.get_loans_by_subscriber(subscriber_id, include_history=True)
 
     def get_loans_by_subscriber(self, subscriber_id: int):
         return self.db.get_loans_by_subscriber(subscriber_id)
@@ -17,19 +43,21 @@ class LoanManager:
         return self.db.get_subscribers_by_book(catalog_code)
 
     def renew_loan(self, subscriber_id: int, catalog_code: str):
-        loan = self.db.get_loan(subscriber_id, catalog_code)
-        if not loan:
-            return False
-        if self.db.has_waitlist_request(catalog_code, loan[3]):
-            return False
-        new_return_date = loan[4] + datetime.timedelta(days=15)
-        self.db.update_loan_return_date(subscriber_id, catalog_code, new_return_date)
-        self.db.update_loan_renewal(subscriber_id, catalog_code, True)
-        return True
+        report = self.db.renew_loans(LOAN_DAYS, subscriber_id, catalog_code)
+        return bool(report) and report[0][4] == 'renewed'
+
+    def renew_loans(self, subscriber_id: int = None):
+        return self.db.renew_loans(LOAN_DAYS, subscriber_id)
 
     def add_waitlist_request(self, subscriber_id: int, catalog_code: str):
         request_date = datetime.date.today()
-        self.db.add_waitlist_request(subscriber_id, catalog_code, request_date)
+        return self.db.add_waitlist_request(subscriber_id, catalog_code, request_date)
+
+    def peek_waitlist(self, catalog_code: str):
+        return self.db.peek_waitlist(catalog_code)
+
+    def get_waitlist_position(self, subscriber_id: int, catalog_code: str):
+        return self.db.get_waitlist_position(subscriber_id, catalog_code)
 
     def get_waitlist_by_book(self, catalog_code: str):
         return self.db.get_waitlist_by_book(catalog_code)
@@ -38,13 +66,8 @@ class LoanManager:
         self.db.remove_waitlist_request(subscriber_id, catalog_code)
 
     def assign_priority_waitlist(self, catalog_code: str):
-        waitlist = self.db.get_waitlist_by_book(catalog_code)
-        if not waitlist:
-            return None
-        subscriber_id = waitlist[0][1]
-        return_date = datetime.date.today()
-        self.db.update_waitlist_priority(subscriber_id, catalog_code, return_date)
-        return subscriber_id
+        claimed = self.db.claim_next_waitlist(catalog_code, datetime.date.today())
+        return claimed.subscriber_id if claimed else None
 
     def clear_priority_waitlist(self, catalog_code: str):
         self.db.clear_priority_waitlist(catalog_code)
@@ -4,6 +4,7 @@ import hashlib
 import secrets
 from datetime import datetime, timedelta
 from database import Database
+from db_worker import BackgroundWorker
 from loan_manager import LoanManager
 from pages.login_page import LoginPage
 from pages.register_page import RegisterPage
@@ -20,7 +21,12 @@ class LibraryApp:
         self.app.geometry("800x600")
 
         self.db = Database()
+        # Last-login times are buffered and written in batches
+        self.db.start_write_behind()
         self.loan_manager = LoanManager(self.db)
+        self.worker = BackgroundWorker(self.app)
+        # Title/author autocomplete for the search box, built off the UI thread
+        self.worker.submit('prefix_index', self.db.build_prefix_index, on_success=self._on_prefix_index_built)
         self._ensure_admin_exists()
 
         # Track current active frame/window
@@ -59,8 +65,6 @@ class LibraryApp:
         login_page = LoginPage(self.app, self)
         login_page.create_frame()
         self.current_frame = login_page.frame
-        self.username_entry = login_page.username_entry
-        self.password_entry = login_page.password_entry
 
     def create_register_frame(self):
         register_page = RegisterPage(self.app, self)
@@ -74,6 +78,11 @@ class LibraryApp:
             default_password = self._hash_password('admin123')
             self.db.add_user('admin', default_password, 'admin@library.com', is_admin=True)
 
+    def _on_prefix_index_built(self, index):
+        stats = index.stats()
+        print(f"Autocomplete index: {stats['words']} words, {stats['postings']} postings, "
+              f"{stats['bytes'] / 2 ** 20:.1f} MiB, built in {stats['build_seconds']:.2f}s")
+
     def _hash_password(self, password, salt=None):
         """Hash a password with optional salt"""
         if salt is None:
@@ -99,35 +108,18 @@ class LibraryApp:
                 basic_plan = self.db.get_subscription_plans()[0]
                 start_date = datetime.now()
                 end_date = start_date + timedelta(days=30)
-                self.db.add_subscription(username, basic_plan[0], start_date.strftime('%Y-%m-%d %H:%M:%S'), end_date.strftime('%Y-%m-%d %H:%M:%S'), 'abonne')
+                self.db.add_subscription(username, basic_plan.id, start_date, end_date, 'abonne')
                 return True
         return False
 
     def login(self, username, password):
         """Authenticate user"""
         user = self.db.get_user(username)
-        if user and self._verify_password(password, user[2]):  # password is at index 2
+        if user and self._verify_password(password, user.password):
+            self.db.record_login(username)
             return True
         return False
 
-    def handle_login(self):
-        username = self.username_entry.get()
-        password = self.password_entry.get()
-
-        if self.login(username, password):
-            messagebox.showinfo("Success", "Login Successful!")
-            self.logged_in_user = username
-            self.create_main_library_frame()
-        else:
-            messagebox.showerror("Error", "Invalid credentials")
-
-    def handle_register(self, username, password, email):
-        if self.register_user(username, password, email):
-            messagebox.showinfo("Success", "Registration Successful!")
-            self.create_login_frame()
-        else:
-            messagebox.showerror("Error", "Registration Failed")
-
     def create_main_library_frame(self):
         main_library_page = MainLibraryPage(self.app, self)
         main_library_page.create_frame()
@@ -138,61 +130,26 @@ class LibraryApp:
         add_book_page.create_frame()
         self.current_frame = add_book_page.frame
 
-    def save_book(self, code_catalogue, cote, date_acquisition, mote_cles, id_editeur, id_theme, title, author, publisher, quantity, window):
-        # Check if any of the fields are empty
-        if not code_catalogue or not cote or not date_acquisition or not title or not author or not publisher or not quantity:
-            messagebox.showerror("Error", "All fields must be filled")
-            return
-
-        try:
-            if self.db.add_book(code_catalogue, cote, date_acquisition, mote_cles, id_editeur, id_theme, title, author, publisher, quantity):
-                messagebox.showinfo("Success", "Book added successfully!")
-                self.create_main_library_frame()
-            else:
-                messagebox.showerror("Error", "Failed to add book")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to add book: {e}")
-
     def show_books(self, username, search_term=None):
         show_books_page = ShowBooksPage(self.app, self)
         show_books_page.create_frame(username, search_term)
         self.current_frame = show_books_page.frame
 
-    def update_book_list(self, books_frame, search_term=None):
-        # Clear previous book list
-        for widget in books_frame.winfo_children():
-            widget.destroy()
-
-        # Retrieve books from database
-        if search_term:
-            books = self.db.search_livres(search_term)
-        else:
-            books = self.db.get_books()
-
-        # Display books
-        if not books:
-            no_books_label = ctk.CTkLabel(books_frame, text="No books available")
-            no_books_label.pack(pady=20, padx=10)
-        else:
-            for book in books:
-                book_label = ctk.CTkLabel(
-                    books_frame,
-                    text=f"Title: {book[7]}, Author: {book[8]}, Category: {book[4]}, Quantity: {book[10]}, Cote: {book[2]}"
-                )
-                book_label.pack(pady=5, padx=10, anchor="w")
-
     def manage_subscriptions(self):
         if not hasattr(self, 'logged_in_user') or self.logged_in_user is None:
             messagebox.showerror("Error", "Please log in to manage subscriptions.")
             return
-        
-        user = self.db.get_user(self.logged_in_user)
-        if user:
-            subscription = self.db.get_current_subscription(user[0])
-            if subscription:
-                messagebox.showinfo("Subscription Status", "You already have an active subscription.")
-                return
-        
+
+        self.worker.submit(
+            'subscription', self.db.get_current_subscription, self.logged_in_user,
+            on_success=self._on_subscription_checked,
+            on_error=lambda e: messagebox.showerror("Error", f"Failed to check subscription: {e}"))
+
+    def _on_subscription_checked(self, subscription):
+        if subscription:
+            messagebox.showinfo("Subscription Status", "You already have an active subscription.")
+            return
+
         subscription_page = SubscriptionPage(self.app, self, self.logged_in_user)
         subscription_page.create_frame()
         self.current_frame = subscription_page.frame
@@ -221,52 +178,65 @@ class LibraryApp:
         card_information_page = CardInformationPage(self.app, self, payment_method, plan_name, plan_price)
         card_information_page.create_frame(parent_window)
         self.current_frame = card_information_page.frame
-        
-        user = self.db.get_user(self.logged_in_user)
-        if user:
-            plan = self.db.get_subscription_plans()
-            selected_plan = next((p for p in plan if p[1] == plan_name), None)
-            if selected_plan:
-                start_date = datetime.now()
-                end_date = start_date + timedelta(days=selected_plan[3] * 30)
-                self.db.add_subscription(user[1], selected_plan[0], start_date.strftime('%Y-%m-%d %H:%M:%S'), end_date.strftime('%Y-%m-%d %H:%M:%S'), 'abonne')
 
-    def get_user_id(self, username):
-        user = self.db.get_user(username)
-        if user:
-            return user[0]
+    def subscribe(self, username, plan_name):
+        """
+        Start a subscription to plan_name for username; runs on the worker
+        thread. Returns an error message, or None on success.
+        """
+        plan = next((p for p in self.db.get_subscription_plans() if p.name == plan_name), None)
+        if plan is None:
+            return "Could not find the selected plan."
+        start_date = datetime.now()
+        end_date = start_date + timedelta(days=plan.duration_months * 30)
+        if not self.db.add_subscription(username, plan.id, start_date, end_date, 'abonne'):
+            return "Failed to save the subscription."
         return None
 
     def show_borrowed_books(self):
         if not hasattr(self, 'logged_in_user') or self.logged_in_user is None:
             messagebox.showerror("Error", "Please log in to view borrowed books.")
             return
-        
-        user_id = self.get_user_id(self.logged_in_user)
-        if user_id:
-            loans = self.loan_manager.get_loans_by_subscriber(user_id)
-            
-            show_books_page = ShowBooksPage(self.app, self)
-            show_books_page.create_frame(self.logged_in_user, "borrowed")
-            self.current_frame = show_books_page.frame
-
-    def borrow_book(self, book_id):
+
+        # The page loads the loans itself on the worker thread
+        show_books_page = ShowBooksPage(self.app, self)
+        show_books_page.create_frame(self.logged_in_user, "borrowed")
+        self.current_frame = show_books_page.frame
+
+    def borrow_book(self, book_id, busy=None):
         if not hasattr(self, 'logged_in_user') or self.logged_in_user is None:
             messagebox.showerror("Error", "Please log in to borrow books.")
             return
-        
-        user = self.db.get_user(self.logged_in_user)
+
+        self.worker.submit(
+            'borrow', self._borrow_book, self.logged_in_user, book_id,
+            on_success=self._on_borrow_result,
+            on_error=lambda e: messagebox.showerror("Error", f"Failed to borrow book: {e}"),
+            busy=busy)
+
+    def _borrow_book(self, username, book_id):
+        """Create the loan; runs on the worker thread"""
+        user = self.db.get_user(username)
         book = self.db.get_book(book_id)
-        if user and book:
-            self.loan_manager.create_loan(user[0], book[1])
-            messagebox.showinfo("Success", f"Book '{book[7]}' borrowed successfully!")
+        if user and book and self.loan_manager.create_loan(user.id, book.code_catalogue):
+            return book
+        return None
+
+    def _on_borrow_result(self, book):
+        if book:
+            messagebox.showinfo("Success", f"Book '{book.title}' borrowed successfully!")
             self.create_main_library_frame()
         else:
             messagebox.showerror("Error", "Failed to borrow book.")
 
     def run(self):
         """Run the main application loop"""
-        self.app.mainloop()
+        try:
+            self.app.mainloop()
+        finally:
+            self.worker.shutdown()
+            # Flushes buffered last-login times before closing connections
+            self.db.close()
 
 if __name__ == "__main__":
     app = LibraryApp()
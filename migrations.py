@@ -0,0 +1,480 @@
+import sqlite3
+
+from trigram_index import index_book_words
+
+# Create the missing exemplaires for livres with id > ? (and <= ? when not
+# NULL), numbering copies 1..quantity with barcode EX<livre id><copy number>.
+# Triggers cannot use WITH, so Database runs this after catalog writes.
+# quantity is read through CAST so a non-numeric value left in the column
+# counts as 0 copies: compared as text, n < 'abc' is always true and the
+# recursion would never end.
+SYNC_COPIES_SQL = '''
+    WITH RECURSIVE copy_numbers(n) AS (
+        SELECT 1
+        UNION ALL
+        SELECT n + 1 FROM copy_numbers
+        WHERE n < (SELECT MAX(CAST(quantity AS INTEGER)) FROM livres WHERE id > ?1 AND (?2 IS NULL OR id <= ?2))
+    )
+    INSERT OR IGNORE INTO exemplaires (livre_id, catalog_code, copy_number, barcode)
+    SELECT l.id, l.code_catalogue, c.n, printf('EX%08d%03d', l.id, c.n)
+    FROM livres l JOIN copy_numbers c ON c.n <= CAST(l.quantity AS INTEGER)
+    WHERE l.id > ?1 AND (?2 IS NULL OR l.id <= ?2)
+'''
+
+# Claim one free copy of a title for a loan; returns (id, barcode) or nothing
+CLAIM_COPY_SQL = '''
+    UPDATE exemplaires SET status = 'on_loan', loan_id = ?
+    WHERE id = (
+        SELECT id FROM exemplaires WHERE catalog_code = ? AND status = 'available' LIMIT 1
+    )
+    RETURNING id, barcode
+'''
+
+
+def _assign_copies_to_existing_loans(cursor):
+    """
+    Give loans recorded before per-copy inventory existed a copy each
+    """
+    loans = cursor.execute('SELECT id, catalog_code FROM loans WHERE copy_id IS NULL ORDER BY id').fetchall()
+    for loan_id, catalog_code in loans:
+        copy = cursor.execute(CLAIM_COPY_SQL, (loan_id, catalog_code)).fetchone()
+        if copy is not None:
+            cursor.execute('UPDATE loans SET copy_id = ? WHERE id = ?', (copy[0], loan_id))
+
+
+def _index_existing_book_words(cursor):
+    """
+    Build the fuzzy-search vocabulary from the books that already exist
+    """
+    index_book_words(cursor, 0)
+
+
+# Numbered schema migrations. The applied version is stored in
+# PRAGMA user_version; each migration runs in its own transaction and bumps
+# the version only if every step succeeds. Steps are SQL strings or
+# callables taking a cursor. Never edit a released migration, append one.
+MIGRATIONS = [
+    (1, 'Base schema', [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            is_admin BOOLEAN DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_login TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS subscription_plans (
+            id INTEGER PRIMARY KEY,
+            name TEXT UNIQUE NOT NULL,
+            price REAL NOT NULL,
+            duration_months INTEGER NOT NULL,
+            description TEXT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS user_subscriptions (
+            id INTEGER PRIMARY KEY,
+            username TEXT NOT NULL,
+            plan_id INTEGER NOT NULL,
+            start_date DATETIME NOT NULL,
+            end_date DATETIME NOT NULL,
+            payment_status TEXT NOT NULL,
+            FOREIGN KEY (username) REFERENCES users (username),
+            FOREIGN KEY (plan_id) REFERENCES subscription_plans (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS livres (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            code_catalogue TEXT NOT NULL,
+            cote TEXT NOT NULL,
+            date_acquisition DATE NOT NULL,
+            mote_cles TEXT,
+            id_editeur TEXT,
+            id_theme TEXT,
+            title TEXT NOT NULL,
+            author TEXT NOT NULL,
+            publisher TEXT NOT NULL,
+            quantity INTEGER NOT NULL DEFAULT 1
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS loans (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            subscriber_id INTEGER NOT NULL,
+            catalog_code TEXT NOT NULL,
+            loan_date DATE NOT NULL,
+            return_date DATE NOT NULL,
+            is_renewed BOOLEAN DEFAULT 0,
+            FOREIGN KEY (subscriber_id) REFERENCES users (id),
+            FOREIGN KEY (catalog_code) REFERENCES livres (code_catalogue)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS waitlist (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            subscriber_id INTEGER NOT NULL,
+            catalog_code TEXT NOT NULL,
+            request_date DATE NOT NULL,
+            priority_date DATE,
+            FOREIGN KEY (subscriber_id) REFERENCES users (id),
+            FOREIGN KEY (catalog_code) REFERENCES livres (code_catalogue)
+        )
+        ''',
+    ]),
+    (2, 'Indexes for loan, waitlist, subscription and catalog lookups', [
+        # get_loan / add_loan duplicate check / get_loans_by_subscriber
+        'CREATE INDEX IF NOT EXISTS idx_loans_subscriber_code ON loans (subscriber_id, catalog_code)',
+        # get_subscribers_by_book
+        'CREATE INDEX IF NOT EXISTS idx_loans_catalog_code ON loans (catalog_code)',
+        # get_waitlist_by_book (ordered scan) and has_waitlist_request (range)
+        'CREATE INDEX IF NOT EXISTS idx_waitlist_code_request_date ON waitlist (catalog_code, request_date)',
+        # remove_waitlist_request / update_waitlist_priority
+        'CREATE INDEX IF NOT EXISTS idx_waitlist_subscriber_code ON waitlist (subscriber_id, catalog_code)',
+        # get_current_subscription: equality on username and status, range
+        # and ORDER BY on end_date
+        'CREATE INDEX IF NOT EXISTS idx_user_subscriptions_active ON user_subscriptions (username, payment_status, end_date)',
+        # joins from loans/waitlist onto livres.code_catalogue
+        'CREATE INDEX IF NOT EXISTS idx_livres_code_catalogue ON livres (code_catalogue)',
+    ]),
+    (3, 'FTS5 catalog search index kept in sync by triggers', [
+        # External-content table: the text lives in livres, the FTS table only
+        # stores the inverted index. remove_diacritics lets "Eluard" match
+        # "Éluard".
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS livres_fts USING fts5(
+            title, author, mote_cles, publisher,
+            content='livres', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS livres_fts_after_insert AFTER INSERT ON livres BEGIN
+            INSERT INTO livres_fts (rowid, title, author, mote_cles, publisher)
+            VALUES (new.id, new.title, new.author, new.mote_cles, new.publisher);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS livres_fts_after_delete AFTER DELETE ON livres BEGIN
+            INSERT INTO livres_fts (livres_fts, rowid, title, author, mote_cles, publisher)
+            VALUES ('delete', old.id, old.title, old.author, old.mote_cles, old.publisher);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS livres_fts_after_update
+        AFTER UPDATE OF title, author, mote_cles, publisher ON livres BEGIN
+            INSERT INTO livres_fts (livres_fts, rowid, title, author, mote_cles, publisher)
+            VALUES ('delete', old.id, old.title, old.author, old.mote_cles, old.publisher);
+            INSERT INTO livres_fts (rowid, title, author, mote_cles, publisher)
+            VALUES (new.id, new.title, new.author, new.mote_cles, new.publisher);
+        END
+        ''',
+        # Index the books that already exist
+        "INSERT INTO livres_fts (livres_fts) VALUES ('rebuild')",
+    ]),
+    (4, 'Per-title available_copies kept exact by triggers', [
+        'ALTER TABLE livres ADD COLUMN available_copies INTEGER NOT NULL DEFAULT 0',
+        '''
+        UPDATE livres SET available_copies = quantity - (
+            SELECT COUNT(*) FROM loans WHERE loans.catalog_code = livres.code_catalogue
+        )
+        ''',
+        # New titles start with every copy on the shelf (minus any loans
+        # already recorded against the code)
+        '''
+        CREATE TRIGGER IF NOT EXISTS livres_available_after_insert AFTER INSERT ON livres BEGIN
+            UPDATE livres SET available_copies = new.quantity - (
+                SELECT COUNT(*) FROM loans WHERE catalog_code = new.code_catalogue
+            ) WHERE id = new.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS livres_available_after_quantity AFTER UPDATE OF quantity ON livres BEGIN
+            UPDATE livres SET available_copies = available_copies + (new.quantity - old.quantity)
+            WHERE id = new.id;
+        END
+        ''',
+        # Refuse the loan inside the INSERT itself, so two desks can never
+        # both take the last copy
+        '''
+        CREATE TRIGGER IF NOT EXISTS loans_check_available BEFORE INSERT ON loans
+        WHEN (SELECT MIN(available_copies) FROM livres WHERE code_catalogue = new.catalog_code) <= 0
+        BEGIN
+            SELECT RAISE(ABORT, 'no copy available');
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS loans_available_after_insert AFTER INSERT ON loans BEGIN
+            UPDATE livres SET available_copies = available_copies - 1
+            WHERE code_catalogue = new.catalog_code;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS loans_available_after_delete AFTER DELETE ON loans BEGIN
+            UPDATE livres SET available_copies = available_copies + 1
+            WHERE code_catalogue = old.catalog_code;
+        END
+        ''',
+    ]),
+    (5, 'Per-copy inventory (exemplaires) generated from livres.quantity', [
+        '''
+        CREATE TABLE IF NOT EXISTS exemplaires (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            livre_id INTEGER NOT NULL,
+            catalog_code TEXT NOT NULL,
+            copy_number INTEGER NOT NULL,
+            barcode TEXT UNIQUE NOT NULL,
+            status TEXT NOT NULL DEFAULT 'available' CHECK (status IN ('available', 'on_loan')),
+            loan_id INTEGER,
+            UNIQUE (livre_id, copy_number),
+            FOREIGN KEY (livre_id) REFERENCES livres (id),
+            FOREIGN KEY (loan_id) REFERENCES loans (id)
+        )
+        ''',
+        # Only free copies are indexed, so claiming one is a single seek
+        "CREATE INDEX IF NOT EXISTS idx_exemplaires_free ON exemplaires (catalog_code) WHERE status = 'available'",
+        'ALTER TABLE loans ADD COLUMN copy_id INTEGER REFERENCES exemplaires (id)',
+        lambda cursor: cursor.execute(SYNC_COPIES_SQL, (0, None)),
+        lambda cursor: _assign_copies_to_existing_loans(cursor),
+        '''
+        CREATE TRIGGER IF NOT EXISTS exemplaires_after_livre_delete AFTER DELETE ON livres BEGIN
+            DELETE FROM exemplaires WHERE livre_id = old.id AND status = 'available';
+        END
+        ''',
+        # Check-in: the loan knows its copy, so releasing it is a primary-key UPDATE
+        '''
+        CREATE TRIGGER IF NOT EXISTS exemplaires_release_after_loan_delete AFTER DELETE ON loans
+        WHEN old.copy_id IS NOT NULL BEGIN
+            UPDATE exemplaires SET status = 'available', loan_id = NULL WHERE id = old.copy_id;
+        END
+        ''',
+    ]),
+    (6, 'Loan returns and the loans_history archive', [
+        # NULL while the loan is open
+        'ALTER TABLE loans ADD COLUMN returned_at DATE',
+        '''
+        CREATE TABLE IF NOT EXISTS loans_history (
+            id INTEGER PRIMARY KEY,
+            subscriber_id INTEGER NOT NULL,
+            catalog_code TEXT NOT NULL,
+            loan_date DATE NOT NULL,
+            return_date DATE NOT NULL,
+            is_renewed BOOLEAN DEFAULT 0,
+            copy_id INTEGER,
+            returned_at DATE NOT NULL
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_loans_history_subscriber_code ON loans_history (subscriber_id, catalog_code)',
+        'CREATE INDEX IF NOT EXISTS idx_loans_history_catalog_code ON loans_history (catalog_code)',
+        # Closed loans still waiting to be archived, oldest return first
+        'CREATE INDEX IF NOT EXISTS idx_loans_closed ON loans (returned_at) WHERE returned_at IS NOT NULL',
+        '''
+        CREATE VIEW IF NOT EXISTS all_loans AS
+        SELECT id, subscriber_id, catalog_code, loan_date, return_date, is_renewed, copy_id, returned_at FROM loans
+        UNION ALL
+        SELECT id, subscriber_id, catalog_code, loan_date, return_date, is_renewed, copy_id, returned_at FROM loans_history
+        ''',
+        # A returned loan has already given its copy back; archiving it must not
+        'DROP TRIGGER IF EXISTS loans_available_after_delete',
+        '''
+        CREATE TRIGGER IF NOT EXISTS loans_available_after_delete AFTER DELETE ON loans
+        WHEN old.returned_at IS NULL BEGIN
+            UPDATE livres SET available_copies = available_copies + 1
+            WHERE code_catalogue = old.catalog_code;
+        END
+        ''',
+        'DROP TRIGGER IF EXISTS exemplaires_release_after_loan_delete',
+        '''
+        CREATE TRIGGER IF NOT EXISTS exemplaires_release_after_loan_delete AFTER DELETE ON loans
+        WHEN old.copy_id IS NOT NULL AND old.returned_at IS NULL BEGIN
+            UPDATE exemplaires SET status = 'available', loan_id = NULL WHERE id = old.copy_id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS loans_after_return AFTER UPDATE OF returned_at ON loans
+        WHEN old.returned_at IS NULL AND new.returned_at IS NOT NULL BEGIN
+            UPDATE livres SET available_copies = available_copies + 1
+            WHERE code_catalogue = new.catalog_code;
+            UPDATE exemplaires SET status = 'available', loan_id = NULL WHERE id = new.copy_id;
+        END
+        ''',
+    ]),
+    (7, 'Index open loans by due date', [
+        # Overdue and due-soon scans; the implicit rowid gives (return_date, id) keyset order
+        'CREATE INDEX IF NOT EXISTS idx_loans_open_return_date ON loans (return_date) WHERE returned_at IS NULL',
+    ]),
+    (8, 'Waitlist queue indexes', [
+        # One queue entry per patron and title; keep the earliest duplicate
+        '''
+        DELETE FROM waitlist WHERE id NOT IN (
+            SELECT MIN(id) FROM waitlist GROUP BY subscriber_id, catalog_code
+        )
+        ''',
+        'DROP INDEX IF EXISTS idx_waitlist_subscriber_code',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_waitlist_subscriber_code ON waitlist (subscriber_id, catalog_code)',
+        # Patrons still waiting (not yet given priority), in queue order; the
+        # implicit rowid breaks ties between requests made the same day
+        'CREATE INDEX IF NOT EXISTS idx_waitlist_queue ON waitlist (catalog_code, request_date) WHERE priority_date IS NULL',
+    ]),
+    (9, 'One open loan per patron and title; copy claimed by the loan insert', [
+        # Close duplicate open loans left by the old check-then-insert race
+        '''
+        UPDATE loans SET returned_at = loan_date
+        WHERE returned_at IS NULL AND id NOT IN (
+            SELECT MIN(id) FROM loans WHERE returned_at IS NULL GROUP BY subscriber_id, catalog_code
+        )
+        ''',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_loans_open_subscriber_code ON loans (subscriber_id, catalog_code) WHERE returned_at IS NULL',
+        '''
+        CREATE TRIGGER IF NOT EXISTS loans_claim_copy_after_insert AFTER INSERT ON loans BEGIN
+            SELECT RAISE(ABORT, 'no free exemplaire') WHERE NOT EXISTS (
+                SELECT 1 FROM exemplaires WHERE catalog_code = new.catalog_code AND status = 'available'
+            );
+            UPDATE loans SET copy_id = (
+                SELECT id FROM exemplaires WHERE catalog_code = new.catalog_code AND status = 'available' LIMIT 1
+            ) WHERE id = new.id;
+            UPDATE exemplaires SET status = 'on_loan', loan_id = new.id
+            WHERE id = (SELECT copy_id FROM loans WHERE id = new.id);
+        END
+        ''',
+    ]),
+    (10, 'Store loan, waitlist and subscription dates as integers', [
+        # DATE columns become days since 1970-01-01 and DATETIME columns
+        # seconds since 1970-01-01 00:00:00 (see records.py); text that does
+        # not parse is left as it is
+        "UPDATE loans SET loan_date = COALESCE(CAST(julianday(substr(loan_date, 1, 10)) - 2440587.5 AS INTEGER), loan_date) WHERE typeof(loan_date) = 'text'",
+        "UPDATE loans SET return_date = COALESCE(CAST(julianday(substr(return_date, 1, 10)) - 2440587.5 AS INTEGER), return_date) WHERE typeof(return_date) = 'text'",
+        "UPDATE loans SET returned_at = COALESCE(CAST(julianday(substr(returned_at, 1, 10)) - 2440587.5 AS INTEGER), returned_at) WHERE typeof(returned_at) = 'text'",
+        "UPDATE loans_history SET loan_date = COALESCE(CAST(julianday(substr(loan_date, 1, 10)) - 2440587.5 AS INTEGER), loan_date) WHERE typeof(loan_date) = 'text'",
+        "UPDATE loans_history SET return_date = COALESCE(CAST(julianday(substr(return_date, 1, 10)) - 2440587.5 AS INTEGER), return_date) WHERE typeof(return_date) = 'text'",
+        "UPDATE loans_history SET returned_at = COALESCE(CAST(julianday(substr(returned_at, 1, 10)) - 2440587.5 AS INTEGER), returned_at) WHERE typeof(returned_at) = 'text'",
+        "UPDATE waitlist SET request_date = COALESCE(CAST(julianday(substr(request_date, 1, 10)) - 2440587.5 AS INTEGER), request_date) WHERE typeof(request_date) = 'text'",
+        "UPDATE waitlist SET priority_date = COALESCE(CAST(julianday(substr(priority_date, 1, 10)) - 2440587.5 AS INTEGER), priority_date) WHERE typeof(priority_date) = 'text'",
+        "UPDATE user_subscriptions SET start_date = COALESCE(CAST(strftime('%s', start_date) AS INTEGER), start_date) WHERE typeof(start_date) = 'text'",
+        "UPDATE user_subscriptions SET end_date = COALESCE(CAST(strftime('%s', end_date) AS INTEGER), end_date) WHERE typeof(end_date) = 'text'",
+    ]),
+    (11, 'Trigram index of catalog words for typo-tolerant search', [
+        # Vocabulary of accent- and case-folded title/author/mote_cles words
+        # (see trigram_index.py). Folding needs Python, so Database keeps
+        # these up to date on catalog writes rather than triggers; words
+        # left without books stay in the vocabulary and simply match nothing.
+        '''
+        CREATE TABLE IF NOT EXISTS catalog_words (
+            id INTEGER PRIMARY KEY,
+            word TEXT UNIQUE NOT NULL,
+            trigram_count INTEGER NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS catalog_word_trigrams (
+            trigram TEXT NOT NULL,
+            word_id INTEGER NOT NULL REFERENCES catalog_words(id),
+            PRIMARY KEY (trigram, word_id)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS catalog_word_books (
+            word_id INTEGER NOT NULL REFERENCES catalog_words(id),
+            livre_id INTEGER NOT NULL REFERENCES livres(id),
+            PRIMARY KEY (word_id, livre_id)
+        ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_catalog_word_books_livre ON catalog_word_books (livre_id)',
+        '''
+        CREATE TRIGGER IF NOT EXISTS catalog_word_books_after_livre_delete AFTER DELETE ON livres BEGIN
+            DELETE FROM catalog_word_books WHERE livre_id = old.id;
+        END
+        ''',
+        _index_existing_book_words,
+    ]),
+    (12, 'Count only open loans when a title is added', [
+        # Migration 4's insert trigger still counted returned loans, so a
+        # title re-added under the code of a returned loan started short
+        'DROP TRIGGER IF EXISTS livres_available_after_insert',
+        '''
+        CREATE TRIGGER livres_available_after_insert AFTER INSERT ON livres BEGIN
+            UPDATE livres SET available_copies = new.quantity - (
+                SELECT COUNT(*) FROM loans
+                WHERE catalog_code = new.code_catalogue AND returned_at IS NULL
+            ) WHERE id = new.id;
+        END
+        ''',
+        # Repair counts the old trigger got wrong
+        '''
+        UPDATE livres SET available_copies = quantity - (
+            SELECT COUNT(*) FROM loans
+            WHERE loans.catalog_code = livres.code_catalogue AND loans.returned_at IS NULL
+        )
+        ''',
+    ]),
+    (13, 'Record catalog objects dropped for a bulk load', [
+        # Database.deferred_catalog_indexes commits each import batch, so
+        # the triggers and index it drops are saved here with the last
+        # livres id before the load; init_database finishes any load that
+        # did not get to recreate them
+        '''
+        CREATE TABLE IF NOT EXISTS deferred_catalog_objects (
+            name TEXT PRIMARY KEY,
+            type TEXT NOT NULL,
+            sql TEXT NOT NULL,
+            after_id INTEGER NOT NULL
+        )
+        ''',
+    ]),
+    (14, 'Let the waitlist queue index cover position counts', [
+        # The planner only takes "priority_date IS NULL" from an index that
+        # stores the column, so the migration 8 index made
+        # get_waitlist_position read every row ahead; with priority_date as
+        # an equality column the queue order (request_date, rowid) is kept
+        'DROP INDEX IF EXISTS idx_waitlist_queue',
+        '''
+        CREATE INDEX idx_waitlist_queue ON waitlist (catalog_code, priority_date, request_date)
+        WHERE priority_date IS NULL
+        ''',
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_version(conn):
+    """
+    Return the schema version recorded in the database file
+    """
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn, target=None):
+    """
+    Apply every pending migration up to target (default: latest).
+
+    Returns the list of versions that were applied.
+    """
+    if target is None:
+        target = LATEST_VERSION
+    current = get_version(conn)
+    applied = []
+    for version, description, steps in MIGRATIONS:
+        if version <= current or version > target:
+            continue
+        cursor = conn.cursor()
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            for step in steps:
+                if callable(step):
+                    step(cursor)
+                else:
+                    cursor.execute(step)
+            # PRAGMA does not accept bound parameters; version is an int literal
+            cursor.execute(f'PRAGMA user_version = {int(version)}')
+            cursor.execute('COMMIT')
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        applied.append(version)
+    return applied
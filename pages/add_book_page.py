@@ -6,6 +6,7 @@ class AddBookPage:
         self.app = app
         self.library_app = library_app
         self.frame = None
+        self.save_button = None
 
     def create_frame(self):
         # Close previous window
@@ -48,7 +49,7 @@ class AddBookPage:
         quantity_entry = ctk.CTkEntry(self.frame, placeholder_text="Quantity")
         quantity_entry.pack(pady=12, padx=10)
 
-        save_button = ctk.CTkButton(self.frame, text="Save", 
+        self.save_button = ctk.CTkButton(self.frame, text="Save",
             command=lambda: self.handle_save_book(
                 code_catalogue_entry.get(),
                 cote_entry.get(),
@@ -61,7 +62,7 @@ class AddBookPage:
                 publisher_entry.get(),
                 quantity_entry.get(),
             ))
-        save_button.pack(pady=12, padx=10)
+        self.save_button.pack(pady=12, padx=10)
 
         # Add back button
         back_button = ctk.CTkButton(self.frame, text="Back", command=self.library_app.create_main_library_frame)
@@ -73,11 +74,21 @@ class AddBookPage:
             messagebox.showerror("Error", "All fields must be filled")
             return
 
-        try:
-            if self.library_app.db.add_book(code_catalogue, cote, date_acquisition, mote_cles, id_editeur, id_theme, title, author, publisher, quantity):
-                messagebox.showinfo("Success", "Book added successfully!")
-                self.library_app.create_main_library_frame()
-            else:
-                messagebox.showerror("Error", "Failed to add book")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to add book: {e}")
+        self.library_app.worker.submit(
+            'add_book', self.library_app.db.add_book,
+            code_catalogue, cote, date_acquisition, mote_cles, id_editeur, id_theme, title, author, publisher, quantity,
+            on_success=self.on_book_saved,
+            on_error=lambda e: messagebox.showerror("Error", f"Failed to add book: {e}"),
+            busy=self.set_busy)
+
+    def on_book_saved(self, ok):
+        if ok:
+            messagebox.showinfo("Success", "Book added successfully!")
+            self.library_app.create_main_library_frame()
+        else:
+            messagebox.showerror("Error", "Failed to add book")
+
+    def set_busy(self, busy):
+        if self.save_button.winfo_exists():
+            self.save_button.configure(state="disabled" if busy else "normal",
+                                       text="Saving..." if busy else "Save")
@@ -8,6 +8,7 @@ class LoginPage:
         self.frame = None
         self.username_entry = None
         self.password_entry = None
+        self.login_button = None
 
     def create_frame(self):
         # Close all existing windows
@@ -26,8 +27,8 @@ class LoginPage:
         self.password_entry = ctk.CTkEntry(self.frame, placeholder_text="Password", show="*")
         self.password_entry.pack(pady=12, padx=10)
 
-        login_button = ctk.CTkButton(self.frame, text="Login", command=self.handle_login)
-        login_button.pack(pady=12, padx=10)
+        self.login_button = ctk.CTkButton(self.frame, text="Login", command=self.handle_login)
+        self.login_button.pack(pady=12, padx=10)
 
         register_button = ctk.CTkButton(self.frame, text="Register", command=self.library_app.create_register_frame)
         register_button.pack(pady=12, padx=10)
@@ -36,9 +37,21 @@ class LoginPage:
         username = self.username_entry.get()
         password = self.password_entry.get()
 
-        if self.library_app.login(username, password):
+        # Password hashing and the user lookup run on the worker thread
+        self.library_app.worker.submit(
+            'login', self.library_app.login, username, password,
+            on_success=lambda ok: self.on_login_result(ok, username),
+            on_error=lambda e: messagebox.showerror("Error", f"Login failed: {e}"),
+            busy=self.set_busy)
+
+    def on_login_result(self, ok, username):
+        if ok:
             messagebox.showinfo("Success", "Login Successful!")
             self.library_app.logged_in_user = username
             self.library_app.create_main_library_frame()
         else:
             messagebox.showerror("Error", "Invalid credentials")
+
+    def set_busy(self, busy):
+        self.login_button.configure(state="disabled" if busy else "normal",
+                                    text="Signing in..." if busy else "Login")
@@ -1,6 +1,5 @@
 import customtkinter as ctk
 import tkinter.messagebox as messagebox
-from datetime import datetime, timedelta
 
 class PaymentPage:
     def __init__(self, app, library_app):
@@ -158,57 +157,32 @@ class CardInformationPage(PaymentPage):
                 messagebox.showerror("Error", "Please fill in all card details")
                 return
 
-            # Here you would typically integrate with a payment gateway
-            # For now, we'll just show a success message
-            messagebox.showinfo("Payment Successful", 
+            if not getattr(self.library_app, 'logged_in_user', None):
+                messagebox.showerror("Error", "Please log in to subscribe.")
+                return
+
+            # Here you would typically integrate with a payment gateway;
+            # the subscription is recorded on the worker thread
+            self.library_app.worker.submit(
+                'subscribe', self.library_app.subscribe, self.library_app.logged_in_user, self.plan_name,
+                on_success=on_subscribed,
+                on_error=lambda e: messagebox.showerror("Error", f"Payment failed: {e}"),
+                busy=set_busy)
+
+        def on_subscribed(error):
+            if error:
+                messagebox.showerror("Error", error)
+                return
+            messagebox.showinfo("Payment Successful",
                                 f"Successfully subscribed to {self.plan_name} plan!")
-            
-            # Get the plan ID from the database
-            plans = self.library_app.db.get_subscription_plans()
-            plan_id = None
-            for plan in plans:
-                if plan[1] == self.plan_name:
-                    plan_id = plan[0]
-                    break
-            if plan_id:
-                # Calculate the end date based on the plan duration
-                start_date = datetime.now()
-                duration_months = 0
-                for plan in plans:
-                    if plan[1] == self.plan_name:
-                        duration_months = plan[3]
-                        break
-                end_date = start_date +  timedelta(days=duration_months*30)
-            # Get the plan ID from the database
-            plans = self.library_app.db.get_subscription_plans()
-            plan_id = None
-            for plan in plans:
-                if plan[1] == self.plan_name:
-                    plan_id = plan[0]
-                    break
-            if plan_id:
-                # Calculate the end date based on the plan duration
-                start_date = datetime.now()
-                duration_months = 0
-                for plan in plans:
-                    if plan[1] == self.plan_name:
-                        duration_months = plan[3]
-                        break
-                end_date = start_date +  timedelta(days=duration_months*30)
-                # Save the subscription to the database
-                if hasattr(self.library_app, 'logged_in_user') and self.library_app.logged_in_user:
-                    user = self.library_app.db.get_user(self.library_app.logged_in_user)
-                    if user:
-                        self.library_app.db.add_subscription(user[0], plan_id, start_date.strftime('%Y-%m-%d %H:%M:%S'), end_date.strftime('%Y-%m-%d %H:%M:%S'), "abonne")
-                        # Close the card info window and return to main window
-                        self.frame.destroy()
-                        self.library_app.create_main_library_frame()
-                    else:
-                        messagebox.showerror("Error", "User not found.")
-                else:
-                    messagebox.showerror("Error", "Please log in to subscribe.")
-            else:
-                messagebox.showerror("Error", "Could not find the selected plan.")
+            # Close the card info window and return to main window
+            self.frame.destroy()
+            self.library_app.create_main_library_frame()
+
+        def set_busy(busy):
+            if confirm_payment_button.winfo_exists():
+                confirm_payment_button.configure(state="disabled" if busy else "normal",
+                                                 text="Processing..." if busy else "Confirm Payment")
 
         def go_back():
             self.frame.destroy()
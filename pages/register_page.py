@@ -6,6 +6,7 @@ class RegisterPage:
         self.app = app
         self.library_app = library_app
         self.frame = None
+        self.register_button = None
 
     def create_frame(self):
         # Close all existing windows
@@ -32,21 +33,32 @@ class RegisterPage:
         email_entry = ctk.CTkEntry(self.frame, placeholder_text="Email")
         email_entry.pack(pady=12, padx=10)
 
-        register_button = ctk.CTkButton(self.frame, text="Register", 
+        self.register_button = ctk.CTkButton(self.frame, text="Register", 
             command=lambda: self.handle_register(
                 username_entry.get(), 
                 password_entry.get(), 
                 email_entry.get()
             ))
-        register_button.pack(pady=12, padx=10)
+        self.register_button.pack(pady=12, padx=10)
 
         # Add back button
         back_button = ctk.CTkButton(self.frame, text="Back", command=self.library_app.create_login_frame)
         back_button.pack(pady=12, padx=10)
 
     def handle_register(self, username, password, email):
-        if self.library_app.register_user(username, password, email):
+        self.library_app.worker.submit(
+            'register', self.library_app.register_user, username, password, email,
+            on_success=self.on_register_result,
+            on_error=lambda e: messagebox.showerror("Error", f"Registration Failed: {e}"),
+            busy=self.set_busy)
+
+    def on_register_result(self, ok):
+        if ok:
             messagebox.showinfo("Success", "Registration Successful!")
             self.library_app.create_login_frame()
         else:
             messagebox.showerror("Error", "Registration Failed")
+
+    def set_busy(self, busy):
+        self.register_button.configure(state="disabled" if busy else "normal",
+                                       text="Registering..." if busy else "Register")
@@ -1,16 +1,76 @@
 import customtkinter as ctk
 import tkinter.messagebox as messagebox
+from cache import MISSING, TTLCache
+from pages.virtual_list import VirtualList
+
+# Only the columns the list actually displays are read from the database
+BOOK_LIST_COLUMNS = ('id', 'title', 'author', 'mote_cles', 'quantity', 'available_copies', 'cote')
+BOOK_PAGE_SIZE = 100
+# Delay after the last keystroke before a live search runs
+SEARCH_DEBOUNCE_MS = 250
+# Autocomplete suggestions shown under the search box
+SUGGESTION_LIMIT = 5
+
+def search_first_page(db, search_term):
+    """
+    First page of exact matches, best first, or, when there are none, the
+    best typo-tolerant matches (a single ranked page: scrolling on asks the
+    exact search for more, which has nothing)
+    """
+    books = db.search_livres_ranked_page(search_term, 0, BOOK_PAGE_SIZE, BOOK_LIST_COLUMNS)
+    return books or db.search_livres_fuzzy(search_term, BOOK_PAGE_SIZE, BOOK_LIST_COLUMNS)
+
+class BookRow:
+    """One recycled row of the virtual book list"""
+    def __init__(self, parent, page, username):
+        self.page = page
+        self.username = username
+        self.book_id = None
+
+        self.widget = ctk.CTkFrame(parent)
+        self.label = ctk.CTkLabel(self.widget, text="")
+        self.label.pack(pady=5, padx=10, anchor="w")
+
+        borrow_button = ctk.CTkButton(self.widget, text="Borrow", command=lambda: self.page.borrow_book(self.book_id, self.username))
+        borrow_button.pack(pady=5, padx=10, side="left")
+
+        delete_button = ctk.CTkButton(self.widget, text="Delete", command=lambda: self.page.delete_book(self.book_id))
+        delete_button.pack(pady=5, padx=10, side="left")
+
+        edit_button = ctk.CTkButton(self.widget, text="Edit", command=lambda: self.page.edit_book(self.book_id))
+        edit_button.pack(pady=5, padx=10, side="left")
+
+    def bind(self, book):
+        book_id, title, author, category, quantity, available, cote = book
+        if book_id == self.book_id:
+            return
+        self.book_id = book_id
+        self.label.configure(text=f"Title: {title}, Author: {author}, Category: {category}, Available: {available}/{quantity}, Cote: {cote}")
+
+    def unbind(self):
+        self.book_id = None
 
 class ShowBooksPage:
-    def __init__(self, app, library_app):
+    def __init__(self, app, library_app, debounce_ms=SEARCH_DEBOUNCE_MS):
         self.app = app
         self.library_app = library_app
         self.frame = None
+        self.debounce_ms = debounce_ms
+        self.search_button = None
+        self.status_label = None
+        self.suggestions_label = None
+        self.suggestions = []
+        # Either a VirtualList (catalog) or a CTkScrollableFrame (loans)
+        self.view = None
+        self.view_kind = None
+        self.search_term = None
+        # Live search: pending after() id, and first result page per query so
+        # backspacing to an earlier query is instant
+        self.search_after_id = None
+        self.live_search_key = None
+        self.search_cache = TTLCache(maxsize=32, ttl=30.0)
 
     def create_frame(self, username, search_term=None):
-        # Retrieve books from database
-        books = self.library_app.db.get_books()
-
         # Close previous window
         if self.library_app.current_frame:
             self.library_app.current_frame.withdraw()
@@ -27,12 +87,22 @@ class ShowBooksPage:
         # Search functionality
         search_entry = ctk.CTkEntry(self.frame, placeholder_text="Search books...")
         search_entry.pack(pady=12, padx=10)
+        search_entry.bind("<KeyRelease>", lambda event: self.schedule_live_search(books_frame, search_entry, username))
+        search_entry.bind("<Tab>", lambda event: self.accept_suggestion(search_entry))
 
-        search_button = ctk.CTkButton(self.frame, text="Search", command=lambda: self.search_books(books_frame, search_entry.get(), username))
-        search_button.pack(pady=12, padx=10)
+        # Title/author completions of the word being typed; Tab takes the first
+        self.suggestions_label = ctk.CTkLabel(self.frame, text="", text_color="gray")
+        self.suggestions_label.pack(padx=10)
+
+        self.search_button = ctk.CTkButton(self.frame, text="Search", command=lambda: self.search_books(books_frame, search_entry.get(), username))
+        self.search_button.pack(pady=12, padx=10)
+
+        # Shows "Loading..." while a query runs in the background
+        self.status_label = ctk.CTkLabel(self.frame, text="")
+        self.status_label.pack(padx=10)
 
         # Create a frame to hold the books list
-        books_frame = ctk.CTkScrollableFrame(self.frame)
+        books_frame = ctk.CTkFrame(self.frame, fg_color="transparent")
         books_frame.pack(pady=20, padx=20, fill="both", expand=True)
 
         if search_term == "borrowed":
@@ -44,138 +114,256 @@ class ShowBooksPage:
         back_button = ctk.CTkButton(self.frame, text="Back", command=self.library_app.create_main_library_frame)
         back_button.pack(pady=10, padx=10)
 
+    def set_busy(self, busy):
+        self.status_label.configure(text="Loading..." if busy else "")
+        self.search_button.configure(state="disabled" if busy else "normal")
+
     def search_books(self, books_frame, search_term, username):
-        subscription = self.library_app.db.get_current_subscription(username)
-        if subscription:
-            self.update_book_list(books_frame, search_term, username)
-        else:
-            messagebox.showerror("Error", "You must be a subscriber to search books.")
+        def on_subscription(subscription):
+            if subscription:
+                self.update_book_list(books_frame, search_term, username)
+            else:
+                messagebox.showerror("Error", "You must be a subscriber to search books.")
+
+        # Same channel as the list itself, so a newer search supersedes this one
+        self.library_app.worker.submit(
+            'book_list', self.library_app.db.get_current_subscription, username,
+            on_success=on_subscription, busy=self.set_busy)
+
+    def show_suggestions(self, text):
+        """Served from the in-memory prefix index, so no debounce is needed"""
+        self.suggestions = self.library_app.db.autocomplete(text, SUGGESTION_LIMIT)
+        self.suggestions_label.configure(text="   ".join(self.suggestions))
+
+    def accept_suggestion(self, search_entry):
+        if not self.suggestions:
+            return None
+        search_entry.delete(0, "end")
+        search_entry.insert(0, self.suggestions[0] + " ")
+        return "break"
+
+    def schedule_live_search(self, books_frame, search_entry, username):
+        """Restart the debounce timer on every keystroke"""
+        self.show_suggestions(search_entry.get())
+        if self.search_after_id is not None:
+            self.frame.after_cancel(self.search_after_id)
+        self.search_after_id = self.frame.after(
+            self.debounce_ms, lambda: self.live_search(books_frame, search_entry.get(), username))
+
+    def live_search(self, books_frame, search_term, username):
+        self.search_after_id = None
+        key = ' '.join(search_term.lower().split())
+        if key == self.live_search_key:
+            # e.g. arrow keys or a trailing space: nothing to re-run
+            return
+        self.live_search_key = key
+        view = self.use_view(books_frame, "catalog", username)
 
-    def update_book_list(self, books_frame, search_term=None, username=None):
-        # Clear previous book list
-        for widget in books_frame.winfo_children():
-            widget.destroy()
+        cached = self.search_cache.get(key)
+        if cached is not MISSING:
+            self.library_app.worker.cancel('book_list')
+            self.show_search_results(view, search_term, key, cached)
+            return
+
+        db = self.library_app.db
+
+        def fetch():
+            if not db.get_current_subscription(username):
+                return None
+            if search_term.strip():
+                return search_first_page(db, search_term)
+            return db.get_books_page(0, BOOK_PAGE_SIZE, BOOK_LIST_COLUMNS)
+
+        # Keep the current results on screen, but stop scrolling from
+        # fetching more of them while the new query runs
+        view.loading = True
+        self.library_app.worker.submit(
+            'book_list', fetch,
+            on_success=lambda books: self.show_search_results(view, search_term, key, books),
+            on_error=lambda e: self.status_label.configure(text=f"Search failed: {e}"),
+            busy=self.set_busy)
+
+    def show_search_results(self, view, search_term, key, books):
+        if not view.winfo_exists():
+            return
+        if books is None:
+            view.loading = False
+            self.status_label.configure(text="You must be a subscriber to search books.")
+            return
+        self.search_cache.set(key, books)
+        self.search_term = search_term
+        view.reset()
+        self.display_book_page(view, books)
+
+    def use_view(self, books_frame, kind, username=None):
+        """Return the list widget for kind, replacing the current one if needed"""
+        if self.view_kind != kind or not self.view.winfo_exists():
+            for widget in books_frame.winfo_children():
+                widget.destroy()
+            if kind == "catalog":
+                self.view = VirtualList(
+                    books_frame,
+                    create_row=lambda parent: BookRow(parent, self, username),
+                    on_need_more=lambda: self.load_book_page(self.view.items[-1][0]),
+                    empty_text="No books available")
+            else:
+                self.view = ctk.CTkScrollableFrame(books_frame)
+            self.view.pack(fill="both", expand=True)
+            self.view_kind = kind
+        return self.view
 
+    def update_book_list(self, books_frame, search_term=None, username=None):
         # Retrieve books from database
         if search_term == "borrowed":
             self.show_borrowed_books(books_frame, username)
-            return
-        elif search_term:
-            books = self.library_app.db.search_livres(search_term)
         else:
-            books = self.library_app.db.get_books()
-
-        # Display books
-        if not books:
-            no_books_label = ctk.CTkLabel(books_frame, text="No books available")
-            no_books_label.pack(pady=20, padx=10)
+            self.search_term = search_term
+            self.use_view(books_frame, "catalog", username).reset()
+            self.load_book_page()
+
+    def load_book_page(self, after_id=0):
+        """Fetch one page of books in the background and append it to the list"""
+        db = self.library_app.db
+        search_term = self.search_term
+        if search_term and not after_id:
+            fetch = lambda: search_first_page(db, search_term)
+        elif search_term:
+            fetch = lambda: db.search_livres_ranked_page(search_term, after_id, BOOK_PAGE_SIZE, BOOK_LIST_COLUMNS)
         else:
-            for book in books:
-                book_frame = ctk.CTkFrame(books_frame)
-                book_frame.pack(pady=10, padx=10, fill="x")
-
-                book_label = ctk.CTkLabel(
-                    book_frame,
-                    text=f"Title: {book[7]}, Author: {book[8]}, Category: {book[4]}, Quantity: {book[10]}, Cote: {book[2]}"
-                )
-                book_label.pack(pady=5, padx=10, anchor="w")
-
-                borrow_button = ctk.CTkButton(book_frame, text="Borrow", command=lambda book_id=book[0], username=username: self.borrow_book(book_id, username))
-                borrow_button.pack(pady=5, padx=10, side="left")
-
-                delete_button = ctk.CTkButton(book_frame, text="Delete", command=lambda book_id=book[0]: self.delete_book(book_id))
-                delete_button.pack(pady=5, padx=10, side="left")
-
-                edit_button = ctk.CTkButton(book_frame, text="Edit", command=lambda book_id=book[0]: self.edit_book(book_id))
-                edit_button.pack(pady=5, padx=10, side="left")
+            fetch = lambda: db.get_books_page(after_id, BOOK_PAGE_SIZE, BOOK_LIST_COLUMNS)
+        view = self.view
+        view.loading = True
+        self.library_app.worker.submit(
+            'book_list', fetch,
+            on_success=lambda books: self.display_book_page(view, books),
+            on_error=lambda e: messagebox.showerror("Error", f"Failed to load books: {e}"),
+            busy=self.set_busy)
+
+    def display_book_page(self, view, books):
+        if view.winfo_exists():
+            # A full page means there may be more to fetch on scroll
+            view.append_items(books, len(books) == BOOK_PAGE_SIZE)
 
     def borrow_book(self, book_id, username):
-        subscription = self.library_app.db.get_current_subscription(username)
-        if subscription:
-            self.library_app.borrow_book(book_id)
-        else:
-            messagebox.showerror("Error", "You must be a subscriber to borrow books.")
+        def on_subscription(subscription):
+            if subscription:
+                self.library_app.borrow_book(book_id, busy=self.set_busy)
+            else:
+                messagebox.showerror("Error", "You must be a subscriber to borrow books.")
+
+        self.library_app.worker.submit(
+            'borrow', self.library_app.db.get_current_subscription, username,
+            on_success=on_subscription, busy=self.set_busy)
 
     def delete_book(self, book_id):
-        if self.library_app.db.delete_book(book_id):
+        self.library_app.worker.submit(
+            'edit_book', self.library_app.db.delete_book, book_id,
+            on_success=self.on_book_deleted,
+            on_error=lambda e: messagebox.showerror("Error", f"Failed to delete book: {e}"),
+            busy=self.set_busy)
+
+    def on_book_deleted(self, ok):
+        if ok:
+            self.search_cache.clear()
             messagebox.showinfo("Success", "Book deleted successfully!")
             self.library_app.show_books(self.library_app.logged_in_user)
         else:
             messagebox.showerror("Error", "Failed to delete book.")
 
     def edit_book(self, book_id):
-        self.create_edit_book_dialog(book_id)
+        # The dialog opens once the book has been read on the worker
+        self.library_app.worker.submit(
+            'edit_book', self.library_app.db.get_book, book_id,
+            on_success=lambda book: self.create_edit_book_dialog(book_id, book),
+            on_error=lambda e: messagebox.showerror("Error", f"Failed to load book: {e}"),
+            busy=self.set_busy)
+
+    def create_edit_book_dialog(self, book_id, book):
+        if not book:
+            messagebox.showerror("Error", "Book not found.")
+            return
 
-    def create_edit_book_dialog(self, book_id):
         edit_window = ctk.CTkToplevel(self.app)
         edit_window.title("Edit Book")
         edit_window.geometry("400x300")
 
-        # Get book information
-        book = self.library_app.db.get_book(book_id)
-
-        if not book:
-            messagebox.showerror("Error", "Book not found.")
-            edit_window.destroy()
-            return
-
         # Title
         ctk.CTkLabel(edit_window, text="Title:").pack(pady=5, padx=10, anchor="w")
         title_entry = ctk.CTkEntry(edit_window)
-        title_entry.insert(0, book[7])
+        title_entry.insert(0, book.title)
         title_entry.pack(pady=5, padx=10, fill="x")
 
         # Author
         ctk.CTkLabel(edit_window, text="Author:").pack(pady=5, padx=10, anchor="w")
         author_entry = ctk.CTkEntry(edit_window)
-        author_entry.insert(0, book[8])
+        author_entry.insert(0, book.author)
         author_entry.pack(pady=5, padx=10, fill="x")
 
         # Category
         ctk.CTkLabel(edit_window, text="Category:").pack(pady=5, padx=10, anchor="w")
         category_entry = ctk.CTkEntry(edit_window)
-        category_entry.insert(0, book[4])
+        category_entry.insert(0, book.mote_cles)
         category_entry.pack(pady=5, padx=10, fill="x")
 
         # Quantity
         ctk.CTkLabel(edit_window, text="Quantity:").pack(pady=5, padx=10, anchor="w")
         quantity_entry = ctk.CTkEntry(edit_window)
-        quantity_entry.insert(0, book[10])
+        quantity_entry.insert(0, book.quantity)
         quantity_entry.pack(pady=5, padx=10, fill="x")
 
         # Cote
         ctk.CTkLabel(edit_window, text="Cote:").pack(pady=5, padx=10, anchor="w")
         cote_entry = ctk.CTkEntry(edit_window)
-        cote_entry.insert(0, book[2])
+        cote_entry.insert(0, book.cote)
         cote_entry.pack(pady=5, padx=10, fill="x")
 
         # Save button
-        save_button = ctk.CTkButton(edit_window, text="Save", command=lambda: self.save_edited_book(book_id, title_entry.get(), author_entry.get(), category_entry.get(), quantity_entry.get(), cote_entry.get(), edit_window))
+        save_button = ctk.CTkButton(edit_window, text="Save", command=lambda: self.save_edited_book(book_id, title_entry.get(), author_entry.get(), category_entry.get(), quantity_entry.get(), cote_entry.get(), edit_window, save_button))
         save_button.pack(pady=10, padx=10)
 
-    def save_edited_book(self, book_id, title, author, category, quantity, cote, edit_window):
-        if self.library_app.db.update_book(book_id, title, author, category, quantity, cote):
+    def save_edited_book(self, book_id, title, author, category, quantity, cote, edit_window, save_button):
+        def set_busy(busy):
+            if save_button.winfo_exists():
+                save_button.configure(state="disabled" if busy else "normal", text="Saving..." if busy else "Save")
+            self.set_busy(busy)
+
+        self.library_app.worker.submit(
+            'edit_book', self.library_app.db.update_book, book_id, title, author, category, quantity, cote,
+            on_success=lambda ok: self.on_book_updated(ok, edit_window),
+            on_error=lambda e: messagebox.showerror("Error", f"Failed to update book: {e}"),
+            busy=set_busy)
+
+    def on_book_updated(self, ok, edit_window):
+        if ok:
+            self.search_cache.clear()
             messagebox.showinfo("Success", "Book updated successfully!")
             edit_window.destroy()
-            self.library_app.create_show_books_frame(self.library_app.current_username)
+            self.library_app.show_books(self.library_app.logged_in_user)
         else:
-            messagebox.showerror("Error", "Failed to update book.")
+            messagebox.showerror("Error", "Failed to update book (check that quantity is a whole number).")
 
     def show_borrowed_books(self, books_frame, username):
-        subscription = self.library_app.db.get_current_subscription(username)
-        if subscription:
-            self.update_borrowed_book_list(books_frame, username)
-        else:
-            messagebox.showerror("Error", "You must be a subscriber to view borrowed books.")
+        db = self.library_app.db
+
+        def fetch_loans():
+            if not db.get_current_subscription(username):
+                return None
+            return db.get_loans_by_subscriber(db.get_user(username).id)
 
-    def update_borrowed_book_list(self, books_frame, username):
+        def on_loans(loans):
+            if loans is None:
+                messagebox.showerror("Error", "You must be a subscriber to view borrowed books.")
+            elif books_frame.winfo_exists():
+                self.update_borrowed_book_list(books_frame, loans)
+
+        self.library_app.worker.submit('book_list', fetch_loans, on_success=on_loans, busy=self.set_busy)
+
+    def update_borrowed_book_list(self, books_frame, loans):
         # Clear previous book list
+        books_frame = self.use_view(books_frame, "loans")
         for widget in books_frame.winfo_children():
             widget.destroy()
 
-        # Retrieve borrowed books from database
-        loans = self.library_app.db.get_loans_by_subscriber(self.library_app.db.get_user(username)[0])
-
         # Display borrowed books with user ID and book title
         if not loans:
             no_books_label = ctk.CTkLabel(books_frame, text="No books borrowed")
@@ -8,26 +8,32 @@ class SubscriptionPage:
         self.library_app = library_app
         self.frame = None
         self.current_user = logged_in_user
+        # Unknown until the check on the worker thread returns
+        self.has_active_subscription = None
+        self.status_label = None
+        self.plan_buttons = []
 
     def check_existing_subscription(self):
-        print("Checking existing subscription...")
-        if self.current_user is not None:
-            user = self.library_app.db.get_user(self.current_user)
-            if user:
-                subscription = self.library_app.db.get_current_subscription(user[0])
-                if subscription:
-                    messagebox.showinfo("Subscription Status", "You already have an active subscription.")
-                    self.has_active_subscription = True
-                    print(f"User has active subscription. self.has_active_subscription: {self.has_active_subscription}")
-                else:
-                    self.has_active_subscription = False
-                    print(f"User does not have active subscription. self.has_active_subscription: {self.has_active_subscription}")
-            else:
-                self.has_active_subscription = False
-                print(f"Invalid user data. self.has_active_subscription: {self.has_active_subscription}")
+        """Look up the subscription on the worker; plans stay disabled until then"""
+        if self.current_user is None:
+            self.on_subscription_checked(None)
+            return
+        self.library_app.worker.submit(
+            'subscription', self.library_app.db.get_current_subscription, self.current_user,
+            on_success=self.on_subscription_checked,
+            on_error=lambda e: messagebox.showerror("Error", f"Failed to check subscription: {e}"))
+
+    def on_subscription_checked(self, subscription):
+        if not self.frame.winfo_exists():
+            return
+        self.has_active_subscription = bool(subscription)
+        if self.has_active_subscription:
+            self.status_label.configure(text="")
+            messagebox.showinfo("Subscription Status", "You already have an active subscription.")
         else:
-            self.has_active_subscription = False
-            print(f"No user logged in. self.has_active_subscription: {self.has_active_subscription}")
+            self.status_label.configure(text="You do not have an active subscription. Please select a plan.")
+            for button in self.plan_buttons:
+                button.configure(state="normal")
 
     def create_frame(self):
         # Close previous window
@@ -37,7 +43,6 @@ class SubscriptionPage:
         # Create subscription window
         self.frame = self.library_app.register_window(ctk.CTkToplevel(self.app))
         self.library_app.current_frame = self.frame
-        self.check_existing_subscription()
         self.frame.title("Subscription Plans")
         self.frame.geometry("600x500")
         self.frame.protocol("WM_DELETE_WINDOW", self.library_app.create_main_library_frame)
@@ -46,9 +51,8 @@ class SubscriptionPage:
         label = ctk.CTkLabel(self.frame, text="Library Subscription Plans", font=("Helvetica", 20, "bold"))
         label.pack(pady=20, padx=10)
 
-        if not self.has_active_subscription:
-            no_subscription_label = ctk.CTkLabel(self.frame, text="You do not have an active subscription. Please select a plan.", font=("Helvetica", 12))
-            no_subscription_label.pack(pady=10, padx=10)
+        self.status_label = ctk.CTkLabel(self.frame, text="Checking your subscription...", font=("Helvetica", 12))
+        self.status_label.pack(pady=10, padx=10)
 
         # Subscription Levels Frame
         plans_frame = ctk.CTkFrame(self.frame)
@@ -68,8 +72,9 @@ class SubscriptionPage:
         basic_price.pack(side="right", padx=10)
 
         basic_button = ctk.CTkButton(basic_frame, text="Select", 
-            command=lambda: self.select_subscription("Basic Plan", 9.99), state="disabled" if self.has_active_subscription else "normal")
+            command=lambda: self.select_subscription("Basic Plan", 9.99), state="disabled")
         basic_button.pack(side="right", padx=10)
+        self.plan_buttons.append(basic_button)
 
         # Premium Plan
         premium_frame = ctk.CTkFrame(plans_frame)
@@ -85,8 +90,9 @@ class SubscriptionPage:
         premium_price.pack(side="right", padx=10)
 
         premium_button = ctk.CTkButton(premium_frame, text="Select", 
-            command=lambda: self.select_subscription("Premium Plan", 19.99),  state="disabled" if self.has_active_subscription else "normal")
+            command=lambda: self.select_subscription("Premium Plan", 19.99), state="disabled")
         premium_button.pack(side="right", padx=10)
+        self.plan_buttons.append(premium_button)
 
         # Enterprise Plan
         enterprise_frame = ctk.CTkFrame(plans_frame)
@@ -102,12 +108,15 @@ class SubscriptionPage:
         enterprise_price.pack(side="right", padx=10)
 
         enterprise_button = ctk.CTkButton(enterprise_frame, text="Select", 
-            command=lambda: self.select_subscription("VIP Plan", 49.99),  state="disabled" if self.has_active_subscription else "normal")
+            command=lambda: self.select_subscription("VIP Plan", 49.99), state="disabled")
         enterprise_button.pack(side="right", padx=10)
+        self.plan_buttons.append(enterprise_button)
 
         # Back button
         back_button = ctk.CTkButton(self.frame, text="Back", command=self.library_app.create_main_library_frame)
         back_button.pack(pady=10, padx=10)
 
+        self.check_existing_subscription()
+
     def select_subscription(self, plan_name, price):
         self.library_app.select_subscription(plan_name, price)
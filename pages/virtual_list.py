@@ -0,0 +1,124 @@
+import customtkinter as ctk
+
+class VirtualList(ctk.CTkFrame):
+    """
+    Scrollable list that only ever creates enough row widgets to fill the
+    visible area plus a small buffer.
+
+    Rows are recycled: scrolling changes which items the existing row
+    widgets are bound to instead of creating new ones, so the widget count
+    does not depend on the number of items. Items are appended page by page;
+    when the user scrolls near the end of what is loaded, on_need_more() is
+    called so the owner can fetch the next page.
+
+    create_row(parent) must return an object with a `widget` attribute and
+    bind(item) / unbind() methods.
+    """
+    def __init__(self, master, create_row, row_height=90, buffer_rows=2, on_need_more=None, empty_text="No items", **kwargs):
+        super().__init__(master, **kwargs)
+        self.create_row = create_row
+        self.row_height = row_height
+        self.buffer_rows = buffer_rows
+        self.on_need_more = on_need_more
+        self.items = []
+        self.has_more = False
+        self.loading = False
+        self.first_index = 0
+        self.rows = []
+        self.visible_count = 1
+
+        self.scrollbar = ctk.CTkScrollbar(self, command=self.on_scrollbar)
+        self.scrollbar.pack(side="right", fill="y")
+        self.body = ctk.CTkFrame(self, fg_color="transparent")
+        self.body.pack(side="left", fill="both", expand=True)
+        # Rows past the bottom edge are clipped instead of growing the window
+        self.body.pack_propagate(False)
+        self.empty_label = ctk.CTkLabel(self.body, text=empty_text)
+
+        self.body.bind("<Configure>", self.on_resize)
+        # Wheel events only while the pointer is over the list
+        self.bind("<Enter>", self.on_enter)
+        self.bind("<Leave>", self.on_leave)
+
+    def reset(self):
+        """Drop all items, e.g. before showing a new search"""
+        self.items = []
+        self.has_more = False
+        self.loading = False
+        self.first_index = 0
+        self.refresh()
+
+    def append_items(self, items, has_more):
+        """Add the next loaded page of items"""
+        self.items.extend(items)
+        self.has_more = has_more
+        self.loading = False
+        self.refresh()
+
+    def on_resize(self, event):
+        self.visible_count = max(1, event.height // self.row_height)
+        # Grow the pool to cover the visible rows plus the buffer; never shrink
+        while len(self.rows) < self.visible_count + self.buffer_rows:
+            self.rows.append(self.create_row(self.body))
+        self.refresh()
+
+    def refresh(self):
+        """Rebind the pooled rows to the items at the current scroll position"""
+        max_first = max(0, len(self.items) - self.visible_count)
+        self.first_index = min(self.first_index, max_first)
+
+        if not self.items and not self.has_more and not self.loading:
+            self.empty_label.pack(pady=20, padx=10)
+        else:
+            self.empty_label.pack_forget()
+
+        for offset, row in enumerate(self.rows):
+            index = self.first_index + offset
+            if index < len(self.items):
+                row.bind(self.items[index])
+                if not row.widget.winfo_manager():
+                    row.widget.pack(pady=5, padx=10, fill="x")
+            else:
+                row.unbind()
+                row.widget.pack_forget()
+
+        total = max(len(self.items), 1)
+        self.scrollbar.set(self.first_index / total, min(1.0, (self.first_index + self.visible_count) / total))
+        self.request_more_if_needed()
+
+    def request_more_if_needed(self):
+        near_end = self.first_index + len(self.rows) >= len(self.items)
+        if near_end and self.has_more and not self.loading and self.on_need_more:
+            self.loading = True
+            self.on_need_more()
+
+    def scroll_by(self, rows):
+        self.first_index = max(0, self.first_index + rows)
+        self.refresh()
+
+    def on_scrollbar(self, action, value, unit=None):
+        if action == "moveto":
+            self.first_index = max(0, int(float(value) * len(self.items)))
+            self.refresh()
+        elif action == "scroll":
+            step = self.visible_count if unit == "pages" else 1
+            self.scroll_by(int(value) * step)
+
+    def on_mousewheel(self, event):
+        self.scroll_by(-1 if event.delta > 0 else 1)
+
+    def on_enter(self, event):
+        self.bind_all("<MouseWheel>", self.on_mousewheel)
+        self.bind_all("<Button-4>", lambda e: self.scroll_by(-1))
+        self.bind_all("<Button-5>", lambda e: self.scroll_by(1))
+
+    def on_leave(self, event):
+        # Moving onto one of our own rows also sends <Leave>; keep scrolling then
+        widget = self.winfo_containing(event.x_root, event.y_root)
+        while widget is not None:
+            if widget is self:
+                return
+            widget = widget.master
+        self.unbind_all("<MouseWheel>")
+        self.unbind_all("<Button-4>")
+        self.unbind_all("<Button-5>")
@@ -0,0 +1,72 @@
+import os
+
+MIB = 1024 * 1024
+
+
+def _mmap_size(limit):
+    """
+    Map the whole database file plus room to grow, up to limit bytes
+    """
+    def size(file_size):
+        return min(limit, max(64 * MIB, file_size * 2))
+    return size
+
+
+# Named PRAGMA sets applied to every connection Database opens. Values may
+# be callables taking the database file size in bytes. Order matters:
+# journal_mode must be set before anything that depends on it.
+PROFILES = {
+    # SQLite's own defaults: rollback journal, synchronous=FULL, no mmap
+    'default': [],
+    # One desk terminal: WAL so the UI can read while a loan is written,
+    # NORMAL sync (durable up to the last checkpoint in WAL mode)
+    'desktop': [
+        ('journal_mode', 'WAL'),
+        ('synchronous', 'NORMAL'),
+        ('temp_store', 'MEMORY'),
+        ('cache_size', -16 * 1024),  # KiB, i.e. 16 MiB
+        ('mmap_size', _mmap_size(256 * MIB)),
+    ],
+    # Shared database behind several terminals: bigger cache and map
+    'server': [
+        ('journal_mode', 'WAL'),
+        ('synchronous', 'NORMAL'),
+        ('temp_store', 'MEMORY'),
+        ('cache_size', -64 * 1024),
+        ('mmap_size', _mmap_size(1024 * MIB)),
+        ('wal_autocheckpoint', 4000),
+    ],
+    # catalog_import: trade durability for speed. An application crash
+    # mid-import is safe, but a power loss can corrupt the file, so back the
+    # database up before a large load.
+    'bulk-load': [
+        ('journal_mode', 'WAL'),
+        ('synchronous', 'OFF'),
+        ('temp_store', 'MEMORY'),
+        ('cache_size', -256 * 1024),
+        ('mmap_size', _mmap_size(1024 * MIB)),
+        ('wal_autocheckpoint', 10000),
+    ],
+}
+
+DEFAULT_PROFILE = 'desktop'
+
+
+def apply_profile(conn, profile, db_path):
+    """
+    Run a profile's PRAGMAs on a freshly opened connection
+    """
+    try:
+        pragmas = PROFILES[profile]
+    except KeyError:
+        raise ValueError(f"Unknown pragma profile: {profile!r} (choose from {', '.join(PROFILES)})")
+    try:
+        file_size = os.path.getsize(db_path)
+    except OSError:
+        # New or in-memory database
+        file_size = 0
+    for name, value in pragmas:
+        if callable(value):
+            value = value(file_size)
+        # PRAGMA values cannot be bound parameters; they come from PROFILES only
+        conn.execute(f'PRAGMA {name} = {value}')
@@ -0,0 +1,205 @@
+import re
+import sys
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def fold_text(text):
+    """
+    Lower-case text and strip accents: 'Émile Zola' -> 'emile zola'
+    """
+    if not text:
+        return ''
+    if text.isascii():
+        return text.lower()
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def tokenize(*texts):
+    """
+    Distinct folded words of the given texts
+    """
+    return {token for text in texts for token in TOKEN_RE.findall(fold_text(text))}
+
+
+class PrefixIndex:
+    """
+    In-memory prefix index over folded title and author words.
+
+    Words are kept in one sorted list and every word owns a compact array
+    of book ids, so a prefix lookup is one bisect plus a walk over the
+    matching words, stopping at limit. Updates insert into or delete from
+    the sorted list and are guarded by a lock; lookups read under the same
+    lock.
+
+    While load() scans the catalog, add/remove/add_many calls are queued
+    and replayed once the scanned rows are in, so changes made during the
+    scan are not lost. Create the index with loading=True to queue changes
+    from the start, before load() is called.
+    """
+    def __init__(self, loading=False):
+        self._words = []
+        self._postings = []
+        self._lock = threading.Lock()
+        # Changes queued while a load() scan runs, else None
+        self._pending = [] if loading else None
+        # Set by load()
+        self.build_seconds = None
+
+    def __len__(self):
+        return len(self._words)
+
+    def _apply(self, change, *args):
+        # Caller holds the lock
+        if self._pending is not None:
+            self._pending.append((change, args))
+        else:
+            change(*args)
+
+    def add(self, book_id, *texts):
+        with self._lock:
+            self._apply(self._add, book_id, texts)
+
+    def remove(self, book_id, *texts):
+        with self._lock:
+            self._apply(self._remove, book_id, texts)
+
+    def add_many(self, rows):
+        """
+        Add (book_id, text, ...) rows in bulk; the word list is re-sorted
+        once instead of being shifted for every new word, so this is the
+        way to index a large import.
+        """
+        postings = self._collect(rows)
+        with self._lock:
+            self._apply(self._merge, postings, True)
+
+    def load(self, rows):
+        """
+        Index a scan of (book_id, text, ...) rows, then replay the changes
+        queued while it ran; records the time taken in build_seconds
+        """
+        started = time.perf_counter()
+        with self._lock:
+            if self._pending is None:
+                self._pending = []
+        postings = {}
+        try:
+            postings = self._collect(rows)
+        finally:
+            with self._lock:
+                self._merge(postings, bool(self._words))
+                # A change may touch a book the scan also read, in either
+                # state; replaying remove-then-add pairs in order converges
+                for change, args in self._pending:
+                    change(*args)
+                self._pending = None
+        self.build_seconds = time.perf_counter() - started
+        return self
+
+    @staticmethod
+    def _collect(rows):
+        postings = {}
+        for book_id, *texts in rows:
+            for word in tokenize(*texts):
+                ids = postings.get(word)
+                if ids is None:
+                    postings[word] = array('q', (book_id,))
+                else:
+                    ids.append(book_id)
+        return postings
+
+    def _add(self, book_id, texts):
+        for word in tokenize(*texts):
+            i = bisect_left(self._words, word)
+            if i == len(self._words) or self._words[i] != word:
+                self._words.insert(i, word)
+                self._postings.insert(i, array('q', (book_id,)))
+            elif book_id not in self._postings[i]:
+                self._postings[i].append(book_id)
+
+    def _remove(self, book_id, texts):
+        for word in tokenize(*texts):
+            i = bisect_left(self._words, word)
+            if i == len(self._words) or self._words[i] != word:
+                continue
+            ids = self._postings[i]
+            while book_id in ids:
+                ids.remove(book_id)
+            if not ids:
+                del self._words[i]
+                del self._postings[i]
+
+    def _merge(self, postings, dedupe):
+        """
+        Fold word -> ids postings into the index; dedupe skips ids a word
+        already lists (needed when the same book can arrive twice, as when
+        replaying changes over a scan)
+        """
+        for word, ids in zip(self._words, self._postings):
+            new_ids = postings.pop(word, None)
+            if new_ids is not None:
+                if dedupe:
+                    known = set(ids)
+                    new_ids = [book_id for book_id in new_ids if book_id not in known]
+                ids.extend(new_ids)
+        if postings:
+            postings.update(zip(self._words, self._postings))
+            self._words = sorted(postings)
+            self._postings = [postings[word] for word in self._words]
+
+    def _range(self, prefix):
+        start = bisect_left(self._words, prefix)
+        return start, bisect_left(self._words, prefix + '\U0010ffff', start)
+
+    def complete(self, prefix, limit=10):
+        """
+        Up to limit indexed words starting with prefix, in alphabetical order
+        """
+        prefix = fold_text(prefix)
+        with self._lock:
+            start, end = self._range(prefix)
+            return self._words[start:min(end, start + limit)]
+
+    def lookup(self, prefix, limit=50):
+        """
+        Up to limit ids of books with a title or author word starting with
+        prefix, exact word matches first
+        """
+        prefix = fold_text(prefix)
+        found = []
+        seen = set()
+        with self._lock:
+            start, end = self._range(prefix)
+            for i in range(start, end):
+                for book_id in self._postings[i]:
+                    if book_id not in seen:
+                        seen.add(book_id)
+                        found.append(book_id)
+                        if len(found) >= limit:
+                            return found
+        return found
+
+    def memory_usage(self):
+        """
+        Approximate bytes held by the index
+        """
+        with self._lock:
+            return (sys.getsizeof(self._words) + sys.getsizeof(self._postings)
+                    + sum(sys.getsizeof(word) for word in self._words)
+                    + sum(sys.getsizeof(ids) for ids in self._postings))
+
+    def stats(self):
+        """
+        Size, approximate memory and build time, for logging
+        """
+        with self._lock:
+            words, book_ids = len(self._words), sum(len(ids) for ids in self._postings)
+        return {'words': words, 'postings': book_ids, 'bytes': self.memory_usage(),
+                'build_seconds': self.build_seconds}
@@ -0,0 +1,191 @@
+import sqlite3
+from datetime import date, datetime, timedelta
+
+# Loan, waitlist and subscription dates are stored as integers: DATE
+# columns as days since 1970-01-01, DATETIME columns as seconds since
+# 1970-01-01 00:00:00 local wall-clock time (no time zone, like the
+# datetime.now() values they replaced).
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+EPOCH = datetime(1970, 1, 1)
+
+
+def to_epoch_day(value):
+    return value.toordinal() - EPOCH_ORDINAL
+
+
+def from_epoch_day(days):
+    return date.fromordinal(days + EPOCH_ORDINAL)
+
+
+def to_epoch_seconds(value):
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return (value - EPOCH) // timedelta(seconds=1)
+
+
+def from_epoch_seconds(seconds):
+    return EPOCH + timedelta(seconds=seconds)
+
+
+# Bind date and datetime parameters as the integers above
+sqlite3.register_adapter(date, to_epoch_day)
+sqlite3.register_adapter(datetime, to_epoch_seconds)
+
+
+def parse_date(value):
+    """
+    Decode a stored DATE: an epoch day, or legacy 'YYYY-MM-DD' text
+    (optionally followed by a time). Values in any other shape are
+    returned unchanged.
+    """
+    if isinstance(value, int):
+        return from_epoch_day(value)
+    if isinstance(value, bytes):
+        value = value.decode()
+        if value.lstrip('-').isdigit():
+            return from_epoch_day(int(value))
+    if isinstance(value, str):
+        try:
+            return date.fromisoformat(value[:10])
+        except ValueError:
+            return value
+    return value
+
+
+def parse_datetime(value):
+    """
+    Decode a stored TIMESTAMP/DATETIME: epoch seconds, or text such as
+    'YYYY-MM-DD HH:MM:SS' or a bare date. Values in any other shape are
+    returned unchanged.
+    """
+    if isinstance(value, int):
+        return from_epoch_seconds(value)
+    if isinstance(value, bytes):
+        value = value.decode()
+        if value.lstrip('-').isdigit():
+            return from_epoch_seconds(int(value))
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return value
+    return value
+
+
+# Decoders by declared column type. They are registered with sqlite3 too,
+# so a query can opt in to eager decoding with detect_types and a
+# '"column [date]"' alias; records call them lazily on attribute access.
+CONVERTERS = {
+    'DATE': parse_date,
+    'DATETIME': parse_datetime,
+    'TIMESTAMP': parse_datetime,
+}
+for _name, _converter in CONVERTERS.items():
+    sqlite3.register_converter(_name, _converter)
+
+
+def _field(index):
+    return property(lambda self: self._row[index])
+
+
+def _decoded_field(index, converter):
+    return property(lambda self: converter(self._row[index]))
+
+
+class Record:
+    """
+    Read-only view of one row, with a named attribute per column.
+
+    The raw row tuple is the only instance state, so building a record is
+    one allocation and it costs far less memory than a dict per row.
+    Indexing and iteration still return the raw stored values, like the
+    tuples these records replace, while attributes of DATE/TIMESTAMP
+    columns are decoded on access.
+
+    Subclasses list their columns in _fields (in SELECT * order) and the
+    declared type of date columns in _types. Use Cls.from_row as a cursor's
+    row_factory.
+    """
+    __slots__ = ('_row',)
+    _fields = ()
+    _types = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for index, name in enumerate(cls._fields):
+            converter = CONVERTERS.get(cls._types.get(name))
+            setattr(cls, name, _field(index) if converter is None else _decoded_field(index, converter))
+
+        def from_row(cursor, row, new=object.__new__):
+            record = new(cls)
+            record._row = row
+            return record
+        cls.from_row = staticmethod(from_row)
+
+    def __init__(self, row):
+        self._row = tuple(row)
+
+    def __getitem__(self, index):
+        return self._row[index]
+
+    def __iter__(self):
+        return iter(self._row)
+
+    def __len__(self):
+        return len(self._row)
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            return type(self) is type(other) and self._row == other._row
+        if isinstance(other, tuple):
+            return self._row == other
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self._row)
+
+    def __repr__(self):
+        values = ', '.join(f'{name}={value!r}' for name, value in zip(self._fields, self._row))
+        return f'{type(self).__name__}({values})'
+
+
+class Book(Record):
+    __slots__ = ()
+    _fields = ('id', 'code_catalogue', 'cote', 'date_acquisition', 'mote_cles', 'id_editeur', 'id_theme',
+               'title', 'author', 'publisher', 'quantity', 'available_copies')
+    # date_acquisition is not decoded: it holds whatever text the form or
+    # import supplied (see database.format_acquisition_date), including
+    # legacy values such as '234' that are not dates at all
+
+
+class User(Record):
+    __slots__ = ()
+    _fields = ('id', 'username', 'password', 'email', 'is_admin', 'created_at', 'last_login')
+    _types = {'created_at': 'TIMESTAMP', 'last_login': 'TIMESTAMP'}
+
+
+class Loan(Record):
+    __slots__ = ()
+    _fields = ('id', 'subscriber_id', 'catalog_code', 'loan_date', 'return_date', 'is_renewed', 'copy_id', 'returned_at')
+    _types = {'loan_date': 'DATE', 'return_date': 'DATE', 'returned_at': 'DATE'}
+
+
+class WaitlistEntry(Record):
+    __slots__ = ()
+    _fields = ('id', 'subscriber_id', 'catalog_code', 'request_date', 'priority_date')
+    _types = {'request_date': 'DATE', 'priority_date': 'DATE'}
+
+
+class SubscriptionPlan(Record):
+    __slots__ = ()
+    _fields = ('id', 'name', 'price', 'duration_months', 'description')
+
+
+class Subscription(Record):
+    """
+    A user_subscriptions row joined with its plan's name and description
+    """
+    __slots__ = ()
+    _fields = ('id', 'username', 'plan_id', 'start_date', 'end_date', 'payment_status',
+               'plan_name', 'plan_description')
+    _types = {'start_date': 'DATETIME', 'end_date': 'DATETIME'}
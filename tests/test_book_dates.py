@@ -0,0 +1,45 @@
+"""
+Regression tests: livres.date_acquisition keeps the text it was given
+instead of being stored and decoded as an epoch day.
+
+Run with: python -m unittest discover tests
+"""
+import os
+import sys
+import tempfile
+import unittest
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from database import Database
+
+BOOK = ('C1', None, 'roman', None, None, 'Germinal', 'Émile Zola', 'Publisher', 1)
+
+
+class BookDateTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = Database(os.path.join(self.tmp.name, 'test.db'))
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    def stored(self):
+        conn = self.db._connect()
+        return conn.execute('SELECT date_acquisition FROM livres ORDER BY id').fetchall()
+
+    def test_date_objects_are_stored_as_text(self):
+        self.assertTrue(self.db.add_book('CAT-1', BOOK[0], date(2024, 1, 2), *BOOK[2:]))
+        self.assertEqual(self.db.add_books([('CAT-2', BOOK[0], date(2024, 3, 4), *BOOK[2:])]), 1)
+        self.assertEqual(self.stored(), [('2024-01-02',), ('2024-03-04',)])
+
+    def test_stored_values_read_back_unchanged(self):
+        self.db.add_book('CAT-1', BOOK[0], '2023-10-27', *BOOK[2:])
+        self.db.add_book('CAT-2', BOOK[0], '234', *BOOK[2:])
+        self.assertEqual([book.date_acquisition for book in self.db.get_books()], ['2023-10-27', 234])
+
+
+if __name__ == '__main__':
+    unittest.main()
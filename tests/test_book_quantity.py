@@ -0,0 +1,95 @@
+"""
+Regression tests: a non-numeric book quantity must be rejected, and copy
+generation must terminate even if one is already stored.
+
+Run with: python -m unittest discover tests
+"""
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from database import Database, parse_quantity
+from migrations import SYNC_COPIES_SQL
+
+BOOK = ('CAT-1', 'C1', '2024-01-01', 'roman', None, None, 'Germinal', 'Émile Zola', 'Publisher')
+
+
+class BookQuantityTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = Database(os.path.join(self.tmp.name, 'test.db'))
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    def copies(self):
+        conn = self.db._connect()
+        return conn.execute('SELECT COUNT(*) FROM exemplaires').fetchone()[0]
+
+    def run_with_timeout(self, fn, seconds=10):
+        """Run fn on a daemon thread and fail instead of hanging the suite"""
+        result = []
+        worker = threading.Thread(target=lambda: result.append(fn()), daemon=True)
+        worker.start()
+        worker.join(seconds)
+        self.assertFalse(worker.is_alive(), "call did not finish")
+        return result[0]
+
+    def test_parse_quantity(self):
+        self.assertEqual(parse_quantity(' 3 '), 3)
+        self.assertEqual(parse_quantity(0), 0)
+        for value in ('abc', '', '2.5', '-1', -1, 2.5, None, True):
+            with self.assertRaises(ValueError):
+                parse_quantity(value)
+
+    def test_add_book_rejects_non_numeric_quantity(self):
+        self.assertFalse(self.db.add_book(*BOOK, quantity='abc'))
+        self.assertEqual(self.db.get_books(), [])
+        self.assertTrue(self.db.add_book(*BOOK, quantity='2'))
+        self.assertEqual(self.db.get_books()[0].quantity, 2)
+        self.assertEqual(self.copies(), 2)
+
+    def test_update_book_rejects_non_numeric_quantity(self):
+        self.db.add_book(*BOOK, quantity=2)
+        book_id = self.db.get_books()[0].id
+        for value in ('abc', ''):
+            self.assertFalse(self.run_with_timeout(
+                lambda: self.db.update_book(book_id, 'T', 'A', 'roman', value, 'c')))
+        self.assertEqual(self.db.get_book(book_id).quantity, 2)
+        self.assertEqual(self.copies(), 2)
+
+    def test_update_book_repairs_stored_text_quantity(self):
+        conn = self.db._connect()
+        conn.execute('''
+            INSERT INTO livres (code_catalogue, cote, date_acquisition, title, author, publisher, quantity)
+            VALUES ('CAT-X', 'C', '2024-01-01', 'T', 'A', 'P', 'abc')
+        ''')
+        conn.commit()
+        book_id = self.db.get_books()[0].id
+        self.assertTrue(self.run_with_timeout(
+            lambda: self.db.update_book(book_id, 'T', 'A', 'roman', '3', 'C')))
+        self.assertEqual(self.db.get_book(book_id).quantity, 3)
+        self.assertEqual(self.copies(), 3)
+
+    def test_add_books_rolls_back_on_bad_quantity(self):
+        self.assertIsNone(self.db.add_books([BOOK + (1,), ('CAT-2',) + BOOK[1:] + ('x',)]))
+        self.assertEqual(self.db.get_books(), [])
+
+    def test_copy_sync_terminates_on_stored_text_quantity(self):
+        conn = self.db._connect()
+        conn.execute('''
+            INSERT INTO livres (code_catalogue, cote, date_acquisition, title, author, publisher, quantity)
+            VALUES ('CAT-X', 'C', '2024-01-01', 'T', 'A', 'P', 'abc')
+        ''')
+        self.run_with_timeout(lambda: conn.execute(SYNC_COPIES_SQL, (0, None)))
+        conn.rollback()
+        self.assertEqual(self.copies(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+"""
+Tests for bulk catalog imports: batches commit on their own and the
+deferred catalog indexes are restored, even after an interrupted load.
+
+Run with: python -m unittest discover tests
+"""
+import csv
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from catalog_import import import_catalog
+from database import Database
+
+DEFERRED = ('livres_fts_after_insert', 'livres_available_after_insert', 'idx_livres_code_catalogue')
+
+
+class CatalogImportTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, 'test.db')
+        self.csv_path = os.path.join(self.tmp.name, 'books.csv')
+        with open(self.csv_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['code_catalogue', 'cote', 'date_acquisition', 'title', 'author', 'publisher', 'quantity'])
+            for i in range(25):
+                writer.writerow([f'CAT-{i}', 'C', '2024-01-01', f'Germinal {i}', 'Émile Zola', 'P', 2])
+        self.db = Database(self.db_path)
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    def assert_catalog_indexed(self, db, count):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            names = conn.execute(f'''
+                SELECT name FROM sqlite_master WHERE name IN ({', '.join('?' * len(DEFERRED))})
+            ''', DEFERRED).fetchall()
+            self.assertEqual(len(names), len(DEFERRED))
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM deferred_catalog_objects').fetchone()[0], 0)
+            self.assertEqual(conn.execute('SELECT MIN(available_copies) FROM livres').fetchone()[0], 2)
+        finally:
+            conn.close()
+        self.assertEqual(len(db.search_livres('germinal', fuzzy=False)), count)
+        self.assertEqual(len(db.search_livres_fuzzy('germinall', 100)), count)
+
+    def test_batches_commit_as_they_go(self):
+        committed = []
+
+        def progress(stats):
+            # Another connection sees each batch as soon as it is flushed
+            conn = sqlite3.connect(self.db_path)
+            committed.append(conn.execute('SELECT COUNT(*) FROM livres').fetchone()[0])
+            conn.close()
+
+        stats = import_catalog(self.db, self.csv_path, batch_size=10, progress=progress)
+        self.assertEqual(stats.imported, 25)
+        self.assertEqual(committed, [10, 20, 25])
+        self.assert_catalog_indexed(self.db, 25)
+
+    def test_interrupted_import_is_restored_on_startup(self):
+        with mock.patch.object(self.db, '_restore_catalog_indexes', side_effect=sqlite3.OperationalError('crash')):
+            with self.assertRaises(sqlite3.OperationalError):
+                import_catalog(self.db, self.csv_path, batch_size=10)
+        self.db.close()
+        self.db = Database(self.db_path)
+        self.assert_catalog_indexed(self.db, 25)
+
+
+if __name__ == '__main__':
+    unittest.main()
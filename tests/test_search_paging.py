@@ -0,0 +1,46 @@
+"""
+Regression test: paging through live search results keeps bm25 order.
+
+Run with: python -m unittest discover tests
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from database import Database
+
+
+class RankedSearchPageTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = Database(os.path.join(self.tmp.name, 'test.db'))
+        # Titles repeat the term 1-4 times, so scores tie and must be split by id
+        self.db.add_books([
+            (f'CAT-{i}', 'C', '2024-01-01', None, None, None, 'hugo ' * (1 + i % 4) + str(i), 'Author', 'P', 1)
+            for i in range(30)
+        ] + [('CAT-V', 'C', '2024-01-01', None, None, None, 'Les Misérables', 'Victor Hugo', 'P', 1)])
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    def test_pages_follow_bm25_order(self):
+        ranked = [book.id for book in self.db.search_livres('hugo')]
+        paged, after_id = [], 0
+        while True:
+            page = self.db.search_livres_ranked_page('hugo', after_id, 7, ('title',))
+            if not page:
+                break
+            paged.extend(row[0] for row in page)
+            after_id = page[-1][0]
+        self.assertEqual(paged, ranked)
+        self.assertEqual(len(paged), 31)
+        # The best match leads, not the lowest id
+        self.assertNotEqual(paged[0], min(paged))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+"""
+Tests for Database.transaction(): commit, rollback and savepoints, cache
+invalidation after the outermost COMMIT, and atomic catalog writes.
+
+Run with: python -m unittest discover tests
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import database
+from database import Database
+
+
+class TransactionTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = Database(os.path.join(self.tmp.name, 'test.db'))
+        self.db.add_user('alice', 'salt:hash', 'alice@example.com')
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    def on_other_thread(self, fn):
+        result = []
+        thread = threading.Thread(target=lambda: result.append(fn()))
+        thread.start()
+        thread.join()
+        return result[0]
+
+    def subscribe(self):
+        plan_id = self.db.get_subscription_plans()[0].id
+        start = datetime.now()
+        return self.db.add_subscription('alice', plan_id, start, start + timedelta(days=30), 'abonne')
+
+    def usernames(self):
+        conn = self.db._connect()
+        return [row[0] for row in conn.execute('SELECT username FROM users ORDER BY id')]
+
+    def test_block_commits_once_at_exit(self):
+        with self.db.transaction():
+            self.db.add_user('bob', 'salt:hash', 'bob@example.com')
+            # Not visible to other connections until the block commits
+            self.assertEqual(self.on_other_thread(self.usernames), ['alice'])
+        self.assertEqual(self.on_other_thread(self.usernames), ['alice', 'bob'])
+
+    def test_exception_rolls_back_and_is_reraised(self):
+        with self.assertRaises(ZeroDivisionError):
+            with self.db.transaction():
+                self.db.add_user('bob', 'salt:hash', 'bob@example.com')
+                1 / 0
+        self.assertEqual(self.usernames(), ['alice'])
+        self.assertFalse(self.db._connect().in_transaction)
+
+    def test_nested_block_rolls_back_only_its_savepoint(self):
+        with self.db.transaction():
+            self.db.add_user('bob', 'salt:hash', 'bob@example.com')
+            with self.assertRaises(ZeroDivisionError):
+                with self.db.transaction():
+                    self.db.add_user('carol', 'salt:hash', 'carol@example.com')
+                    1 / 0
+            with self.db.transaction():
+                self.db.add_user('dave', 'salt:hash', 'dave@example.com')
+        self.assertEqual(self.usernames(), ['alice', 'bob', 'dave'])
+
+    def test_cache_is_invalidated_after_commit(self):
+        with self.db.transaction():
+            self.assertTrue(self.subscribe())
+            # Another thread still sees, and caches, the state before the commit
+            self.assertIsNone(self.on_other_thread(lambda: self.db.get_current_subscription('alice')))
+        self.assertIsNotNone(self.db.get_current_subscription('alice'))
+
+    def test_callbacks_are_dropped_on_rollback(self):
+        calls = []
+        with self.assertRaises(ZeroDivisionError):
+            with self.db.transaction():
+                self.db._after_commit(lambda: calls.append('outer'))
+                1 / 0
+        with self.db.transaction():
+            self.db._after_commit(lambda: calls.append('kept'))
+            with self.assertRaises(ZeroDivisionError):
+                with self.db.transaction():
+                    self.db._after_commit(lambda: calls.append('savepoint'))
+                    1 / 0
+            self.assertEqual(calls, [])
+        self.assertEqual(calls, ['kept'])
+
+    def count(self, table):
+        return self.db._connect().execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+    def test_add_book_is_atomic_inside_a_transaction(self):
+        with mock.patch.object(database, 'index_book_words', side_effect=sqlite3.OperationalError('boom')):
+            with self.db.transaction():
+                self.assertFalse(self.db.add_book('CAT-1', 'C1', '2024-01-01', title='T', author='A',
+                                                  publisher='P', quantity=2))
+        self.assertEqual(self.count('livres'), 0)
+        self.assertEqual(self.count('exemplaires'), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
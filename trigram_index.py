@@ -0,0 +1,66 @@
+from prefix_index import tokenize
+
+# Words shorter than this are not indexed for fuzzy matching: they carry
+# little to correct and would only add huge posting lists ("de", "la").
+MIN_WORD_LENGTH = 3
+
+# livres rows read per pass by index_book_words
+INDEX_CHUNK_SIZE = 5000
+
+
+def trigrams(word):
+    """
+    Distinct trigrams of a folded word, padded like PostgreSQL's pg_trgm so
+    the word's start and end weigh more: 'hugo' -> '  h', ' hu', 'hug',
+    'ugo', 'go '
+    """
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def fuzzy_words(*texts):
+    """
+    Folded words of texts that take part in fuzzy matching
+    """
+    return {word for word in tokenize(*texts) if len(word) >= MIN_WORD_LENGTH}
+
+
+def _word_id(cursor, word):
+    row = cursor.execute('SELECT id FROM catalog_words WHERE word = ?', (word,)).fetchone()
+    if row is not None:
+        return row[0]
+    grams = trigrams(word)
+    cursor.execute('INSERT INTO catalog_words (word, trigram_count) VALUES (?, ?)', (word, len(grams)))
+    word_id = cursor.lastrowid
+    cursor.executemany(
+        'INSERT INTO catalog_word_trigrams (trigram, word_id) VALUES (?, ?)',
+        ((gram, word_id) for gram in grams))
+    return word_id
+
+
+def index_book_words(cursor, after_id, last_id=None):
+    """
+    Link livres with id > after_id (and <= last_id when given) to the words
+    of their title, author and mote_cles, adding words not seen before to
+    the vocabulary with their trigrams. Reads the rows INDEX_CHUNK_SIZE at
+    a time. Books already linked are skipped (INSERT OR IGNORE).
+    """
+    while True:
+        rows = cursor.execute('''
+            SELECT id, title, author, mote_cles FROM livres
+            WHERE id > ?1 AND (?2 IS NULL OR id <= ?2)
+            ORDER BY id
+            LIMIT ?3
+        ''', (after_id, last_id, INDEX_CHUNK_SIZE)).fetchall()
+        if not rows:
+            return
+        books_by_word = {}
+        for book_id, *texts in rows:
+            for word in fuzzy_words(*texts):
+                books_by_word.setdefault(word, []).append(book_id)
+        for word, book_ids in books_by_word.items():
+            word_id = _word_id(cursor, word)
+            cursor.executemany(
+                'INSERT OR IGNORE INTO catalog_word_books (word_id, livre_id) VALUES (?, ?)',
+                ((word_id, book_id) for book_id in book_ids))
+        after_id = rows[-1][0]
@@ -0,0 +1,78 @@
+import threading
+
+
+class WriteBehindBuffer:
+    """
+    Coalescing buffer for low-value writes such as last-login timestamps.
+
+    put(key, value) only records the latest value per key in memory. A
+    background thread hands everything buffered to flush_fn(dict) in one
+    call every interval seconds, or as soon as max_pending distinct keys are
+    waiting. Values that fail to flush are kept and retried, newer values
+    for the same key winning. close() flushes whatever is left.
+    """
+    def __init__(self, flush_fn, interval=5.0, max_pending=500, name='write-behind'):
+        self.flush_fn = flush_fn
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending = {}
+        self._lock = threading.Lock()
+        # Serializes flushes from the timer thread and close()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def put(self, key, value):
+        if self._closed:
+            raise RuntimeError("Write-behind buffer is closed")
+        with self._lock:
+            self._pending[key] = value
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self._wake.set()
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """
+        Write out everything buffered so far; returns the number of keys
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            try:
+                ok = self.flush_fn(batch)
+            except Exception as e:
+                print(f"Error flushing write-behind buffer: {e}")
+                ok = False
+            if ok is False:
+                with self._lock:
+                    # Keep anything newer that arrived during the flush
+                    batch.update(self._pending)
+                    self._pending = batch
+                return 0
+            return len(batch)
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if not self._closed:
+                self.flush()
+
+    def close(self):
+        """
+        Stop the background thread and flush what is left
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self._thread.join()
+        self.flush()
@@ -0,0 +1,148 @@
+import queue
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+
+def is_lock_error(error):
+    """
+    Whether an sqlite3 error means another connection holds the lock
+    """
+    return isinstance(error, sqlite3.OperationalError) and ('locked' in str(error) or 'busy' in str(error))
+
+
+def backoff_delay(attempt):
+    """
+    Jittered exponential backoff, capped at half a second
+    """
+    return min(0.5, 0.01 * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+
+class WriteQueueFull(Exception):
+    """
+    Raised when the writer is too far behind to accept another write
+    """
+
+
+class WriterService:
+    """
+    Funnel every Database mutation through one writer thread.
+
+    Writes are queued as (fn, args) and the writer runs them in group
+    commits: it takes the first pending write, keeps collecting for at most
+    max_delay seconds or max_batch writes, then runs the whole group in one
+    BEGIN IMMEDIATE transaction with one savepoint per write, so a failing
+    write is rolled back alone. Each caller gets a Future resolved with its
+    own write's return value once the group has committed, after the
+    writes' post-commit callbacks (see Database._after_commit) have run.
+
+    The queue is bounded (max_pending); submit() blocks for up to
+    put_timeout seconds when it is full and then raises WriteQueueFull.
+    If another process holds the write lock, the group is retried with
+    exponential backoff up to max_retries times.
+    """
+    def __init__(self, db, max_batch=64, max_delay=0.005, max_pending=1000, put_timeout=5.0, max_retries=5):
+        self.db = db
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.put_timeout = put_timeout
+        self.max_retries = max_retries
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self._thread.start()
+
+    def owns_current_thread(self):
+        return threading.current_thread() is self._thread
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Queue fn(*args, **kwargs) for the writer and return its Future
+        """
+        if self._stopping:
+            raise RuntimeError("Writer service is stopped")
+        future = Future()
+        try:
+            self._queue.put((future, fn, args, kwargs), timeout=self.put_timeout)
+        except queue.Full:
+            raise WriteQueueFull(f"{self._queue.maxsize} writes already pending")
+        return future
+
+    def stop(self):
+        """
+        Finish every queued write, then stop the writer thread
+        """
+        if self._stopping:
+            return
+        self._stopping = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self):
+        """
+        Block for the first write, then gather more until the group is full
+        or max_delay has passed. Returns (group, stop_requested).
+        """
+        first = self._queue.get()
+        if first is None:
+            return [], True
+        group = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(group) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return group, True
+            group.append(item)
+        return group, False
+
+    def _run(self):
+        stop = False
+        while not stop:
+            group, stop = self._collect()
+            # Drop writes whose caller already gave up on them
+            group = [item for item in group if item[0].set_running_or_notify_cancel()]
+            if group:
+                self._commit_group(group)
+        # Anything submitted after stop() was requested still gets run
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None and item[0].set_running_or_notify_cancel():
+                self._commit_group([item])
+
+    def _commit_group(self, group):
+        for attempt in range(self.max_retries + 1):
+            outcomes = []
+            try:
+                with self.db.transaction():
+                    for _, fn, args, kwargs in group:
+                        try:
+                            with self.db.transaction():
+                                outcomes.append((True, fn(*args, **kwargs)))
+                        except Exception as e:
+                            outcomes.append((False, e))
+            except sqlite3.OperationalError as e:
+                if is_lock_error(e) and attempt < self.max_retries:
+                    time.sleep(backoff_delay(attempt))
+                    continue
+                for future, _, _, _ in group:
+                    future.set_exception(e)
+                return
+            except Exception as e:
+                for future, _, _, _ in group:
+                    future.set_exception(e)
+                return
+            break
+        for (future, _, _, _), (ok, value) in zip(group, outcomes):
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)